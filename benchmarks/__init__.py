@@ -0,0 +1,4 @@
+"""
+Package: benchmarks
+Load and micro benchmarks of the Shopcarts service, run by hand
+"""
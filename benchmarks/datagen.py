@@ -0,0 +1,303 @@
+"""
+Synthetic data generator of large Shopcart tables
+
+Streams millions of items straight into the shopcart table with COPY, or
+with batched multi-row INSERTs, instead of creating them one by one like
+tests/factories.py does. Quantities, prices and hold are drawn from the
+declarations of ItemFactory. Item ids come from a catalogue of --catalog
+ids and follow a Zipf law of exponent --item-skew, so a few hot items are
+in many carts. Cart sizes between --min-items and --max-items follow a
+power law of exponent --size-skew, so most carts are small and a few are
+huge. A skew of 0 is uniform.
+
+    DATABASE_URI=postgresql://... python benchmarks/datagen.py --users 1000000 --replace --defer-indexes
+
+The carts get the user ids from --first-user on. COPY fails on carts that
+already exist; --replace deletes the carts of that range first and moves
+their versions on, so clients holding an old ETag see the change.
+--defer-indexes drops the secondary indexes of the table during the load
+and builds them again at the end, which is much faster for big loads. The
+same --seed gives the same rows.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateIndex
+
+# run as a script from anywhere, the service and tests packages are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLUMNS = ("user_id", "item_id", "item_name", "quantity", "price", "hold")
+
+
+def factory_fields():
+    """ Returns the quantity, price and hold declarations of ItemFactory """
+    from tests.factories import ItemFactory
+
+    declarations = ItemFactory._meta.declarations  # pylint: disable=protected-access
+    return declarations["quantity"], declarations["price"], declarations["hold"]
+
+
+def zipf_weights(count, skew):
+    """ Returns the cumulative weights of the ranks 1 to count, rank ** -skew """
+    return list(itertools.accumulate(rank ** -skew for rank in range(1, count + 1)))
+
+
+class Generator:
+    """ The rows of the synthetic carts, derived from the seed only """
+
+    def __init__(self, users, first_user=1, catalog=10_000, item_skew=1.1,
+                 min_items=1, max_items=50, size_skew=1.5, seed=0):
+        if not 1 <= min_items <= max_items <= catalog:
+            raise ValueError("cart sizes must be between 1 and the size of the catalogue")
+        self.users = users
+        self.first_user = first_user
+        self.seed = seed
+        rng = random.Random(f"{seed}:catalogue")
+        # the hot items are spread over the ids instead of being the lowest ones
+        self.item_ids = list(range(catalog))
+        rng.shuffle(self.item_ids)
+        self.item_weights = zipf_weights(catalog, item_skew)
+        self.sizes = list(range(min_items, max_items + 1))
+        self.size_weights = zipf_weights(len(self.sizes), size_skew)
+        self.quantity, self.price, self.hold = factory_fields()
+        # filled in by rows()
+        self.cart_sizes = Counter()
+        self.item_carts = Counter()
+
+    def user_ids(self):
+        """ Returns the user ids of the carts """
+        return range(self.first_user, self.first_user + self.users)
+
+    def cart_items(self, rng):
+        """ Returns the distinct item ids of one cart """
+        size = rng.choices(self.sizes, cum_weights=self.size_weights)[0]
+        chosen = set()
+        while len(chosen) < size:
+            chosen.update(rng.choices(self.item_ids, cum_weights=self.item_weights, k=size - len(chosen)))
+        return sorted(chosen)
+
+    def rows(self):
+        """ Yields the (user_id, item_id, item_name, quantity, price, hold) of every item """
+        rng = random.Random(f"{self.seed}:rows")
+        quantity, price = self.quantity, self.price
+        for user_id in self.user_ids():
+            item_ids = self.cart_items(rng)
+            self.cart_sizes[len(item_ids)] += 1
+            self.item_carts.update(item_ids)
+            for item_id in item_ids:
+                yield (
+                    user_id, item_id, f"ring{item_id}",
+                    rng.randrange(quantity.low, quantity.high + 1, quantity.step),
+                    round(rng.uniform(price.low, price.high), price.precision),
+                    self.hold,
+                )
+
+    def summary(self, hot=10):
+        """ Returns the distribution of the rows generated so far """
+        sizes = sorted(self.cart_sizes.elements())
+        carts = len(sizes)
+        if not carts:
+            return {"carts": 0, "rows": 0}
+        return {
+            "carts": carts,
+            "rows": sum(sizes),
+            "cart_size": {
+                "mean": round(sum(sizes) / carts, 2),
+                "p50": sizes[carts // 2],
+                "p90": sizes[min(carts - 1, carts * 9 // 10)],
+                "p99": sizes[min(carts - 1, carts * 99 // 100)],
+                "max": sizes[-1],
+            },
+            "distinct_items": len(self.item_carts),
+            "hot_items": [
+                {"item_id": item_id, "carts": count, "share": round(count / carts, 4)}
+                for item_id, count in self.item_carts.most_common(hot)
+            ],
+        }
+
+
+######################################################################
+# L O A D I N G
+######################################################################
+
+def copy_value(value):
+    """ Returns a value in the text format of COPY """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def copy_batch(cursor, table, rows):
+    """ Writes rows with one COPY """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(copy_value, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+
+
+def insert_batch(cursor, table, rows):
+    """ Writes rows with multi-row INSERTs """
+    from psycopg2.extras import execute_values
+
+    execute_values(cursor, f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES %s", rows, page_size=1000)
+
+
+def batches(rows, size):
+    """ Yields lists of up to size rows """
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def load(engine, generator, method="copy", batch_size=50_000, replace=False, defer_indexes=False,
+         progress=None):
+    """
+    Loads the rows of a generator into the shopcart table
+
+    Every batch is committed on its own, so a big load does not hold one
+    huge transaction open.
+
+    Returns:
+        int: the number of rows loaded
+    """
+    from service.models import Shopcart, ShopcartVersion
+
+    table = Shopcart.__table__
+    write = copy_batch if method == "copy" else insert_batch
+    user_ids = generator.user_ids()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if replace:
+            cursor.execute(f"DELETE FROM {table.name} WHERE user_id >= %s AND user_id < %s",
+                           (user_ids.start, user_ids.stop))
+            cursor.execute(f"UPDATE {ShopcartVersion.__tablename__} SET version = version + 1 "
+                           "WHERE user_id >= %s AND user_id < %s", (user_ids.start, user_ids.stop))
+        if defer_indexes:
+            for index in table.indexes:
+                cursor.execute(f"DROP INDEX IF EXISTS {index.name}")
+        connection.commit()
+        loaded = 0
+        try:
+            for batch in batches(generator.rows(), batch_size):
+                write(cursor, table.name, batch)
+                connection.commit()
+                loaded += len(batch)
+                if progress:
+                    progress(loaded)
+        finally:
+            connection.rollback()
+            if defer_indexes:
+                for index in table.indexes:
+                    cursor.execute(str(CreateIndex(index).compile(dialect=engine.dialect)))
+                connection.commit()
+        # the planner needs the new statistics to pick the indexes
+        cursor.execute(f"ANALYZE {table.name}")
+        connection.commit()
+        return loaded
+    finally:
+        connection.close()
+
+
+######################################################################
+# R U N N I N G
+######################################################################
+
+def database_uri(uri):
+    """ Returns a URI SQLAlchemy accepts, Cloud Foundry still hands out postgres:// """
+    return "postgresql://" + uri[len("postgres://"):] if uri.startswith("postgres://") else uri
+
+
+def run(args):
+    """ Generates the rows, loads them unless --dry-run and returns the report """
+    generator = Generator(args.users, args.first_user, args.catalog, args.item_skew,
+                          args.min_items, args.max_items, args.size_skew, args.seed)
+    started = time.perf_counter()
+
+    def progress(loaded):
+        elapsed = time.perf_counter() - started
+        print(f"{loaded:>12,} rows {loaded / elapsed:>10,.0f} rows/s", file=sys.stderr)
+
+    if args.dry_run:
+        rows = sum(1 for _ in generator.rows())
+    else:
+        engine = create_engine(database_uri(args.database_uri))
+        if engine.dialect.name != "postgresql":
+            raise SystemExit("the data generator only loads PostgreSQL")
+        rows = load(engine, generator, args.method, args.batch, args.replace, args.defer_indexes, progress)
+        engine.dispose()
+    seconds = time.perf_counter() - started
+    return {
+        "meta": {
+            "seed": args.seed,
+            "method": "none" if args.dry_run else args.method,
+            "first_user": args.first_user,
+            "catalog": args.catalog,
+            "item_skew": args.item_skew,
+            "size_skew": args.size_skew,
+        },
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        **generator.summary(),
+    }
+
+
+def parse_args(argv=None):
+    """ Parses the command line """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-uri", default=os.getenv("DATABASE_URI"), help="defaults to $DATABASE_URI")
+    parser.add_argument("--users", type=int, default=100_000, help="number of carts")
+    parser.add_argument("--first-user", type=int, default=1_000_000, help="user id of the first cart")
+    parser.add_argument("--catalog", type=int, default=10_000, help="number of distinct item ids")
+    parser.add_argument("--item-skew", type=float, default=1.1, help="Zipf exponent of the item ids, 0 is uniform")
+    parser.add_argument("--min-items", type=int, default=1, help="smallest cart")
+    parser.add_argument("--max-items", type=int, default=50, help="biggest cart")
+    parser.add_argument("--size-skew", type=float, default=1.5, help="power law exponent of the cart sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--method", choices=("copy", "insert"), default="copy")
+    parser.add_argument("--batch", type=int, default=50_000, help="rows per COPY or transaction")
+    parser.add_argument("--replace", action="store_true", help="delete the carts of the user ids first")
+    parser.add_argument("--defer-indexes", action="store_true", help="build the secondary indexes after the load")
+    parser.add_argument("--dry-run", action="store_true", help="only print the distribution of the rows")
+    parser.add_argument("--output", help="JSON file the report is written to")
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.batch < 1:
+        parser.error("--users and --batch must be positive")
+    if not 1 <= args.min_items <= args.max_items <= args.catalog:
+        parser.error("cart sizes must be between 1 and --catalog")
+    if not args.dry_run and not args.database_uri:
+        parser.error("set DATABASE_URI or --database-uri")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
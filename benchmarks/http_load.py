@@ -0,0 +1,357 @@
+"""
+HTTP load benchmark of the Shopcarts REST API
+
+Seeds a reproducible dataset of --users shopcarts with --items items each
+through the API, then drives a weighted mix of the /shopcarts endpoints
+from --concurrency threads for --duration seconds. Throughput and the
+p50/p95/p99 latency of every endpoint are printed and written as JSON to
+--output, so runs before and after a change can be compared.
+
+The service must be running against PostgreSQL (its queries use
+PostgreSQL only SQL, so SQLite cannot stand in), e.g.
+
+    flask db upgrade && gunicorn --config=gunicorn.conf.py service:app
+    python benchmarks/http_load.py --users 1000 --items 10 --concurrency 16 --output before.json
+
+The dataset uses user ids from --first-user on, so it does not touch the
+other shopcarts of the database. The same --seed gives the same dataset
+and the same sequence of requests of each thread.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import requests
+
+# relative weights of the operations of the default mix
+DEFAULT_MIX = {
+    "get_shopcart": 35,
+    "get_item": 20,
+    "list_shopcarts": 5,
+    "query_item": 5,
+    "search": 5,
+    "create_item": 10,
+    "update_item": 10,
+    "hold_item": 5,
+    "patch_items": 5,
+}
+
+
+class Dataset:
+    """ The shopcarts of the benchmark, derived from the seed only """
+
+    def __init__(self, users, items, first_user, seed):
+        self.users = users
+        self.items = items
+        self.first_user = first_user
+        self.seed = seed
+
+    def user_ids(self):
+        """ Returns the user ids of the shopcarts """
+        return range(self.first_user, self.first_user + self.users)
+
+    def shopcart(self, user_id):
+        """ Returns the items a shopcart is seeded with """
+        rng = random.Random(f"{self.seed}:{user_id}")
+        return [
+            {
+                "item_id": item_id,
+                "item_name": f"item {item_id}",
+                "quantity": rng.randint(1, 10),
+                "price": round(rng.uniform(0.5, 500), 2),
+                "hold": rng.random() < 0.1,
+            }
+            for item_id in range(self.items)
+        ]
+
+    def random_user(self, rng):
+        """ Returns a user id of the dataset """
+        return self.first_user + rng.randrange(self.users)
+
+    def random_item(self, rng):
+        """ Returns an item id every shopcart of the dataset holds """
+        return rng.randrange(self.items)
+
+
+######################################################################
+# O P E R A T I O N S
+######################################################################
+# each returns (endpoint label, method, path, JSON body or None)
+
+def get_shopcart(data, rng):
+    return "GET /shopcarts/{id}", "GET", f"/shopcarts/{data.random_user(rng)}", None
+
+
+def get_item(data, rng):
+    path = f"/shopcarts/{data.random_user(rng)}/items/{data.random_item(rng)}"
+    return "GET /shopcarts/{id}/items/{id}", "GET", path, None
+
+
+def list_shopcarts(data, rng):
+    return "GET /shopcarts", "GET", f"/shopcarts?limit=100&after={data.random_user(rng)}", None
+
+
+def query_item(data, rng):
+    return "GET /shopcarts?item-id", "GET", f"/shopcarts?item-id={data.random_item(rng)}&limit=100", None
+
+
+def search(data, rng):
+    user_ids = [data.random_user(rng) for _ in range(20)]
+    return "POST /shopcarts/search", "POST", "/shopcarts/search", {"user_ids": user_ids}
+
+
+def create_item(data, rng):
+    # merge keeps the item ids of the dataset, posting an existing item adds to its quantity
+    item_id = data.random_item(rng)
+    body = {"item_id": item_id, "item_name": f"item {item_id}", "quantity": 1, "price": 9.99}
+    return ("POST /shopcarts/{id}/items", "POST",
+            f"/shopcarts/{data.random_user(rng)}/items?merge=true", body)
+
+
+def update_item(data, rng):
+    path = f"/shopcarts/{data.random_user(rng)}/items/{data.random_item(rng)}"
+    return "PUT /shopcarts/{id}/items/{id}", "PUT", path, {"quantity": rng.randint(1, 10)}
+
+
+def hold_item(data, rng):
+    action = rng.choice(("hold", "resume"))
+    path = f"/shopcarts/{data.random_user(rng)}/items/{data.random_item(rng)}/{action}"
+    return f"PUT /shopcarts/{{id}}/items/{{id}}/{action}", "PUT", path, None
+
+
+def patch_items(data, rng):
+    operations = [
+        {"op": "update", "item_id": data.random_item(rng), "quantity": rng.randint(1, 10)},
+        {"op": "hold", "item_id": data.random_item(rng), "hold": rng.random() < 0.5},
+    ]
+    return "PATCH /shopcarts/{id}/items", "PATCH", f"/shopcarts/{data.random_user(rng)}/items", operations
+
+
+OPERATIONS = {
+    "get_shopcart": get_shopcart,
+    "get_item": get_item,
+    "list_shopcarts": list_shopcarts,
+    "query_item": query_item,
+    "search": search,
+    "create_item": create_item,
+    "update_item": update_item,
+    "hold_item": hold_item,
+    "patch_items": patch_items,
+}
+
+
+def parse_mix(text):
+    """ Parses "get_shopcart=50,get_item=20" into a dict of weights """
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}', use one of {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(f"bad weight for '{name}': {weight}") from error
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs a positive weight")
+    return mix
+
+
+######################################################################
+# S T A T I S T I C S
+######################################################################
+
+def percentile(sorted_values, share):
+    """ Returns the nearest-rank percentile of sorted values, None when empty """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(share * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, statuses, errors, seconds):
+    """ Returns the statistics of one endpoint, latencies in milliseconds """
+    values = sorted(latencies)
+    count = len(values) + errors
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / seconds, 2) if seconds else 0.0,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1]) if values else None,
+        "status_codes": {str(code): number for code, number in sorted(statuses.items())},
+    }
+
+
+class Recorder:
+    """ Latencies and status codes of each endpoint, shared by the threads """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, endpoint, seconds, status_code):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status_code] += 1
+
+    def record_error(self, endpoint):
+        with self._lock:
+            self.errors[endpoint] += 1
+
+    def report(self, seconds):
+        """ Returns the statistics of every endpoint and of all of them """
+        endpoints = sorted(set(self.latencies) | set(self.errors))
+        everything = [latency for endpoint in endpoints for latency in self.latencies[endpoint]]
+        all_statuses = sum((self.statuses[endpoint] for endpoint in endpoints), Counter())
+        return {
+            "total": summarize(everything, all_statuses, sum(self.errors.values()), seconds),
+            "endpoints": {
+                endpoint: summarize(self.latencies[endpoint], self.statuses[endpoint],
+                                    self.errors[endpoint], seconds)
+                for endpoint in endpoints
+            },
+        }
+
+
+######################################################################
+# R U N N I N G
+######################################################################
+
+def seed_dataset(base_url, data, concurrency):
+    """ Replaces the shopcarts of the dataset through the API """
+    user_ids = list(data.user_ids())
+
+    def seed(chunk):
+        with requests.Session() as session:
+            for user_id in chunk:
+                session.delete(f"{base_url}/shopcarts/{user_id}").raise_for_status()
+                session.post(f"{base_url}/shopcarts",
+                             json={"user_id": user_id, "items": data.shopcart(user_id)}).raise_for_status()
+
+    threads = [threading.Thread(target=seed, args=(user_ids[index::concurrency],))
+               for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def worker(base_url, data, mix, rng, deadline, recorder, measure_after):
+    """ Sends requests of the mix until the deadline """
+    names, weights = list(mix), list(mix.values())
+    with requests.Session() as session:
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            endpoint, method, path, body = OPERATIONS[rng.choices(names, weights)[0]](data, rng)
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+            except requests.RequestException:
+                if started >= measure_after:
+                    recorder.record_error(endpoint)
+                continue
+            if started >= measure_after:
+                recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+
+
+def run(args):
+    """ Seeds the dataset, runs the load and returns the report """
+    base_url = args.base_url.rstrip("/")
+    data = Dataset(args.users, args.items, args.first_user, args.seed)
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed_dataset(base_url, data, args.concurrency)
+        print(f"Seeded {args.users} shopcarts of {args.items} items in "
+              f"{time.perf_counter() - started:.1f} s", file=sys.stderr)
+    recorder = Recorder()
+    start = time.perf_counter()
+    measure_after = start + args.warmup
+    deadline = measure_after + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(base_url, data, args.mix, random.Random(f"{args.seed}:{index}"),
+                                              deadline, recorder, measure_after))
+        for index in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = recorder.report(args.duration)
+    report["config"] = {
+        "base_url": base_url, "users": args.users, "items": args.items, "first_user": args.first_user,
+        "seed": args.seed, "concurrency": args.concurrency, "duration_s": args.duration,
+        "warmup_s": args.warmup, "mix": args.mix,
+    }
+    report["run"] = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "host": platform.node(),
+    }
+    return report
+
+
+def print_report(report, out=sys.stdout):
+    """ Prints the report as a table """
+    header = f"{'endpoint':<40} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for endpoint, stats in rows:
+        print(f"{endpoint:<40} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms'] or '-':>8} {stats['p95_ms'] or '-':>8} {stats['p99_ms'] or '-':>8}", file=out)
+
+
+def parse_args(argv=None):
+    """ Parses the command line """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000", help="where the service runs")
+    parser.add_argument("--users", type=int, default=200, help="shopcarts in the dataset")
+    parser.add_argument("--items", type=int, default=10, help="items in each shopcart")
+    parser.add_argument("--first-user", type=int, default=1_000_000, help="first user id of the dataset")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the dataset and of the requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="threads sending requests")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="weights of the operations, e.g. get_shopcart=50,update_item=10 "
+                             f"(operations: {', '.join(OPERATIONS)})")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the dataset of the last run")
+    parser.add_argument("--output", help="JSON file the report is written to")
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.items < 1 or args.concurrency < 1:
+        parser.error("--users, --items and --concurrency must be positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Micro-benchmarks of the model layer
+
+Times the hot paths of service/models.py in-process: serializing and
+deserializing an item, marshalling it with flask-restx next to the
+compiled serializer and validator, and the Shopcart queries for carts of
+--sizes items. Each benchmark is run --repeat times with a loop count
+picked by timeit, and its median time per call is kept.
+
+    DATABASE_URI=postgresql://... python benchmarks/micro.py --output after.json --compare before.json
+
+With --compare the exit status is 1 when a benchmark got slower than the
+baseline by more than --threshold (10% by default), so two commits can be
+compared on the same machine. The database benchmarks use their own user
+ids from --first-user on and delete their rows when they are done; they
+are skipped with --no-db.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+
+# run as a script from anywhere, the service package is in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_SIZES = (1, 10, 100)
+
+
+def measure(func, repeat):
+    """ Returns the per call seconds of repeated runs of func, and the loops of each run """
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    return [seconds / loops for seconds in timer.repeat(repeat=repeat, number=loops)], loops
+
+
+def summarize(times, loops):
+    """ Returns the statistics of one benchmark in microseconds """
+    return {
+        "median_us": round(statistics.median(times) * 1e6, 3),
+        "min_us": round(min(times) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(times) * 1e6, 3) if len(times) > 1 else 0.0,
+        "loops": loops,
+        "repeat": len(times),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the medians of two runs
+
+    Returns:
+        list: (name, baseline us, current us, ratio, regressed) of the benchmarks of both runs
+    """
+    rows = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_us"], current["median_us"]
+        ratio = after / before if before else float("inf")
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+######################################################################
+# B E N C H M A R K S
+######################################################################
+
+def item_data(user_id, item_id):
+    """ Returns the fields of an item of the benchmarks """
+    return {"user_id": user_id, "item_id": item_id, "item_name": f"item {item_id}",
+            "quantity": 3, "price": 19.99, "hold": False}
+
+
+def cpu_benchmarks():
+    """ Returns the benchmarks that do not use the database """
+    from flask_restx import marshal
+    from service.models import Shopcart
+    from service import routes
+
+    data = item_data(1, 1)
+    item = Shopcart(**data)
+    body = dict(data)
+    del body["user_id"]
+    return {
+        "serialize": item.serialize,
+        "deserialize": lambda: Shopcart().deserialize(data),
+        "marshal[item_model]": lambda: marshal(item, routes.item_model),
+        "compiled[item_model]": lambda: routes.serialize_item(item),
+        "validate[create_item_model]": lambda: routes.validate_item.validate(body),
+    }
+
+
+class Database:
+    """ Seeds the carts of the database benchmarks and removes them afterwards """
+
+    def __init__(self, app, sizes, first_user):
+        self.app = app
+        self.sizes = sizes
+        self.first_user = first_user
+        self.user_ids = {size: first_user + index for index, size in enumerate(sizes)}
+
+    def __enter__(self):
+        from service.models import Shopcart, db
+
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self._delete()
+        Shopcart.create_many([
+            Shopcart(**item_data(user_id, item_id))
+            for size, user_id in self.user_ids.items() for item_id in range(size)
+        ])
+        return self
+
+    def __exit__(self, *exc):
+        from service.models import db
+
+        db.session.rollback()
+        self._delete()
+        self.context.pop()
+
+    def _delete(self):
+        from service.models import Shopcart
+
+        for user_id in self.user_ids.values():
+            Shopcart.delete_shopcart(user_id)
+
+    def benchmarks(self):
+        """ Returns the query benchmarks of every cart size """
+        from service.models import Shopcart, db
+        from service.utils.cache import LRUCache
+
+        def uncached(func):
+            def run():
+                func()
+                # as a request would, so the identity map does not grow
+                db.session.remove()
+            return run
+
+        cache = LRUCache(maxsize=1000, ttl=3600)
+
+        def cached(user_id):
+            def run():
+                Shopcart.cache = cache
+                try:
+                    Shopcart.find_shopcart(user_id)
+                finally:
+                    Shopcart.cache = LRUCache()
+            return run
+
+        benchmarks = {}
+        for size, user_id in self.user_ids.items():
+            last_item = size - 1
+            benchmarks.update({
+                f"find_shopcart[{size}]": uncached(lambda u=user_id: Shopcart.find_shopcart(u, cached=False)),
+                f"find_shopcart[{size},cached]": cached(user_id),
+                f"find_item[{size}]": uncached(
+                    lambda u=user_id, i=last_item: Shopcart.find_item(u, i, cached=False)),
+                f"query_by_item_id[{size}]": uncached(
+                    lambda i=last_item: Shopcart.query_by_item_id(i, limit=100)),
+            })
+        benchmarks["all_shopcart[100]"] = uncached(lambda: Shopcart.all_shopcart(limit=100))
+        return benchmarks
+
+
+######################################################################
+# R U N N I N G
+######################################################################
+
+def git_commit():
+    """ Returns the commit of the working tree, None outside of git """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """ Runs the benchmarks and returns the report """
+    from service import app
+
+    app.logger.disabled = True
+    if os.getenv("DATABASE_URI"):
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
+    results = {}
+
+    def time_all(benchmarks):
+        for name, func in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            times, loops = measure(func, args.repeat)
+            results[name] = summarize(times, loops)
+            print(f"{name:<36} {results[name]['median_us']:>12.3f} us", file=sys.stderr)
+
+    time_all(cpu_benchmarks())
+    if not args.no_db:
+        with Database(app, args.sizes, args.first_user) as database:
+            time_all(database.benchmarks())
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "sizes": list(args.sizes),
+            "repeat": args.repeat,
+        },
+        "benchmarks": results,
+    }
+
+
+def parse_sizes(text):
+    """ Parses "1,10,100" into a tuple of cart sizes """
+    try:
+        sizes = tuple(int(size) for size in text.split(","))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"bad cart sizes: {text}") from error
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError("cart sizes must be positive")
+    return sizes
+
+
+def parse_args(argv=None):
+    """ Parses the command line """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES, help="cart sizes, e.g. 1,10,100")
+    parser.add_argument("--repeat", type=int, default=7, help="runs of each benchmark")
+    parser.add_argument("--filter", help="only run the benchmarks whose name contains this")
+    parser.add_argument("--first-user", type=int, default=2_000_000, help="first user id of the carts")
+    parser.add_argument("--no-db", action="store_true", help="skip the database benchmarks")
+    parser.add_argument("--output", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="JSON file of a baseline run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown over the baseline that fails the comparison (0.10 is 10%%)")
+    args = parser.parse_args(argv)
+    if args.repeat < 2:
+        parser.error("--repeat must be at least 2")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+    if not args.compare:
+        return 0
+    with open(args.compare) as baseline_file:
+        baseline = json.load(baseline_file)
+    rows = compare(report["benchmarks"], baseline["benchmarks"], args.threshold)
+    print(f"{'benchmark':<36} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for name, before, after, ratio, regressed in rows:
+        print(f"{name:<36} {before:>12.3f} {after:>12.3f} {ratio - 1:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} benchmarks slower than {baseline['meta'].get('commit')} "
+              f"by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
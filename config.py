@@ -17,5 +17,51 @@ if "VCAP_SERVICES" in os.environ:
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Configure the connection pool of each worker
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    # seconds before a connection is replaced, -1 keeps it forever
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "yes", "1"),
+}
+
+# Per-worker cache of shopcart lookups (0 items disables it)
+SHOPCART_CACHE_SIZE = int(os.getenv("SHOPCART_CACHE_SIZE", "0"))
+SHOPCART_CACHE_TTL = float(os.getenv("SHOPCART_CACHE_TTL", "30"))
+
+# Default and largest page of shopcarts returned by GET /shopcarts
+SHOPCART_PAGE_SIZE = int(os.getenv("SHOPCART_PAGE_SIZE", "100"))
+SHOPCART_PAGE_SIZE_MAX = int(os.getenv("SHOPCART_PAGE_SIZE_MAX", "1000"))
+# Most Shopcarts returned by one POST /shopcarts/search, and how many
+# user ids are sent to the database per query
+SHOPCART_SEARCH_MAX = int(os.getenv("SHOPCART_SEARCH_MAX", "5000"))
+SHOPCART_SEARCH_CHUNK_SIZE = int(os.getenv("SHOPCART_SEARCH_CHUNK_SIZE", "1000"))
+# Most operations accepted by one PATCH /shopcarts/<id>/items
+SHOPCART_OPERATIONS_MAX = int(os.getenv("SHOPCART_OPERATIONS_MAX", "1000"))
+# Rows fetched from the server-side cursor per chunk of GET /shopcarts?stream=true
+SHOPCART_STREAM_CHUNK_SIZE = int(os.getenv("SHOPCART_STREAM_CHUNK_SIZE", "1000"))
+
+# Encoder of the API responses: "orjson", "json" or "auto" (orjson if installed)
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+
+# Server-Timing header with the SQL statements of each request, and budgets
+# over which a request is logged with the fingerprints of its statements
+# (0 disables a budget)
+SQL_TIMING_HEADER = os.getenv("SQL_TIMING_HEADER", "true").lower() in ("true", "yes", "1")
+SQL_BUDGET_QUERIES = int(os.getenv("SQL_BUDGET_QUERIES", "0"))
+SQL_BUDGET_MS = float(os.getenv("SQL_BUDGET_MS", "0"))
+# Log the statement count and time of every request
+SQL_LOG_REQUESTS = os.getenv("SQL_LOG_REQUESTS", "false").lower() in ("true", "yes", "1")
+
+# Logging: "text" or "json" lines, written by a background thread through a
+# queue of LOG_QUEUE_SIZE records (dropped when full), and the share of the
+# records below WARNING that are kept
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() in ("true", "yes", "1")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
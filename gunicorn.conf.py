@@ -0,0 +1,179 @@
+"""
+Gunicorn configuration for production
+
+Workers and threads are sized from the CPUs and the memory limit of the
+container unless WEB_CONCURRENCY / GUNICORN_THREADS set them. The app is
+preloaded in the master: importing it opens no database connection and
+every forked worker drops the pool it inherits (see Shopcart.dispose_pool).
+
+Settings read from the environment:
+    PORT                      port to listen on (8000)
+    WEB_CONCURRENCY           number of workers (auto)
+    GUNICORN_WORKER_CLASS     gthread or gevent (gthread)
+    GUNICORN_THREADS          threads per gthread worker (auto)
+    GUNICORN_WORKER_MEMORY    memory of one worker in MB, used to size workers (96)
+    GUNICORN_PRELOAD          load the app before forking workers (true)
+    GUNICORN_TIMEOUT          seconds a silent worker lives before it is restarted (30)
+    GUNICORN_GRACEFUL_TIMEOUT seconds workers get to finish their requests on restart (30)
+    GUNICORN_KEEPALIVE        seconds an idle client connection is kept open (5)
+    GUNICORN_MAX_REQUESTS     requests before a worker is recycled, 0 never (1000)
+    GUNICORN_MAX_REQUESTS_JITTER  random extra requests so workers don't recycle together (100)
+    PROMETHEUS_MULTIPROC_DIR  where workers write their metrics, emptied at start (a temp dir)
+"""
+import os
+import shutil
+import tempfile
+
+# memory the master and the preloaded code need besides the workers, in MB
+MASTER_MEMORY = 64
+# threads of a gthread worker when GUNICORN_THREADS is not set
+DEFAULT_THREADS = 4
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def cpu_count():
+    """ Returns the CPUs this process may use, honouring a cgroup CPU quota """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            count = min(count, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def memory_limit():
+    """ Returns the memory limit of the container in MB, None when unknown """
+    # Cloud Foundry sets MEMORY_LIMIT like "256m" or "1g"
+    value = os.getenv("MEMORY_LIMIT", "").strip().lower()
+    if value[:-1].isdigit() and value[-1:] in ("m", "g"):
+        return int(value[:-1]) * (1024 if value[-1] == "g" else 1)
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as limit:
+                value = limit.read().strip()
+        except OSError:
+            continue
+        # an unlimited cgroup v1 reports a huge number instead of "max"
+        if value.isdigit() and int(value) < 1 << 50:
+            return int(value) // (1024 * 1024)
+    return None
+
+
+def worker_count(cpus, memory, worker_memory):
+    """ Returns 2 workers per CPU plus one, as many as fit in the memory limit """
+    count = 2 * cpus + 1
+    if memory is not None:
+        count = min(count, (memory - MASTER_MEMORY) // worker_memory)
+    return max(1, count)
+
+
+def thread_count(pool_size, max_overflow):
+    """
+    Returns the threads of a gthread worker
+
+    Every thread may hold one database connection, so a worker never runs
+    more threads than its pool can hand out without waiting.
+    """
+    return max(1, min(_env_int("GUNICORN_THREADS", DEFAULT_THREADS), pool_size + max_overflow))
+
+
+######################################################################
+# Server socket
+######################################################################
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+######################################################################
+# Worker processes
+######################################################################
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class not in ("gthread", "gevent"):
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be gthread or gevent, not '{worker_class}'")
+workers = _env_int("WEB_CONCURRENCY", 0) or worker_count(
+    cpu_count(), memory_limit(), _env_int("GUNICORN_WORKER_MEMORY", 96)
+)
+if worker_class == "gthread":
+    threads = thread_count(_env_int("DB_POOL_SIZE", 5), _env_int("DB_MAX_OVERFLOW", 10))
+else:
+    # greenlets wait for a pooled connection instead of failing, see DB_POOL_TIMEOUT
+    worker_connections = _env_int("GUNICORN_WORKER_CONNECTIONS", 100)
+
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("true", "yes", "1")
+
+######################################################################
+# Metrics
+######################################################################
+# must be set before prometheus_client is imported by the app
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "shopcart-metrics")
+)
+
+######################################################################
+# Logging
+######################################################################
+accesslog = "-"
+errorlog = "-"
+
+
+######################################################################
+# Server hooks
+######################################################################
+def on_starting(server):
+    """ Empties the metrics of the last run and logs the sizing once in the master """
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    server.log.info(
+        "Starting %s %s workers%s", workers, worker_class,
+        f" with {threads} threads" if worker_class == "gthread" else "",
+    )
+
+
+def post_fork(server, worker):
+    """ Makes psycopg2 cooperative in gevent workers """
+    if worker_class != "gevent":
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("psycogreen is not installed, database calls will block the gevent worker")
+        return
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    """ Logs how long the worker took to start """
+    from service import startup
+
+    startup.mark("worker")
+    worker.log.info("Worker %s ready, startup %s", worker.pid, startup.snapshot()["steps"])
+
+
+def worker_exit(server, worker):
+    """ Closes the pooled connections of a worker that stops """
+    from service.models import Shopcart, db
+
+    if Shopcart.app is not None:
+        db.get_engine(Shopcart.app).dispose()
+
+
+def child_exit(server, worker):
+    """ Drops the gauges of a worker that stopped from the metrics """
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
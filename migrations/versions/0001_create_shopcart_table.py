@@ -0,0 +1,36 @@
+"""create shopcart table
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Deployments made before migrations existed already have this table
+    # from db.create_all(), so only stamp them with this revision
+    if sa.inspect(op.get_bind()).has_table('shopcart'):
+        return
+    op.create_table('shopcart',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('item_name', sa.String(length=63), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('price', sa.Float(), nullable=True),
+        sa.Column('hold', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('user_id', 'item_id')
+    )
+
+
+def downgrade():
+    op.drop_table('shopcart')
@@ -0,0 +1,41 @@
+"""add index on shopcart.item_id
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def _valid_indexes():
+    """ Returns the names of the usable indexes on the shopcart table """
+    return set(op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = 'shopcart'::regclass AND i.indisvalid"
+    )).scalars())
+
+
+def upgrade():
+    if 'ix_shopcart_item_id' in _valid_indexes():
+        return
+    # Build the index without locking the table against writes, a failed
+    # concurrent build leaves an INVALID index behind so drop it first
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_shopcart_item_id')
+        op.create_index('ix_shopcart_item_id', 'shopcart', ['item_id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shopcart_item_id', table_name='shopcart',
+                      postgresql_concurrently=True)
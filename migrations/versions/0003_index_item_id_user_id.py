@@ -0,0 +1,46 @@
+"""replace the item_id index with an (item_id, user_id) index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def _valid_indexes():
+    """ Returns the names of the usable indexes on the shopcart table """
+    return set(op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = 'shopcart'::regclass AND i.indisvalid"
+    )).scalars())
+
+
+def upgrade():
+    # Shopcarts containing an item are listed in user_id order, which the
+    # composite index returns without a sort
+    indexes = _valid_indexes()
+    with op.get_context().autocommit_block():
+        if 'ix_shopcart_item_id_user_id' not in indexes:
+            # a failed concurrent build leaves an INVALID index behind
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_shopcart_item_id_user_id')
+            op.create_index('ix_shopcart_item_id_user_id', 'shopcart', ['item_id', 'user_id'],
+                            postgresql_concurrently=True)
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_shopcart_item_id')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_shopcart_item_id')
+        op.create_index('ix_shopcart_item_id', 'shopcart', ['item_id'],
+                        postgresql_concurrently=True)
+        op.drop_index('ix_shopcart_item_id_user_id', table_name='shopcart',
+                      postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""add the shopcart_version table
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Deployments made with db.create_all() may already have this table
+    if not sa.inspect(op.get_bind()).has_table('shopcart_version'):
+        op.create_table('shopcart_version',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id')
+        )
+    # Every existing Shopcart starts at version 1, so no client holds its ETag yet
+    op.execute(
+        "INSERT INTO shopcart_version (user_id, version) "
+        "SELECT DISTINCT user_id, 1 FROM shopcart ON CONFLICT (user_id) DO NOTHING"
+    )
+
+
+def downgrade():
+    op.drop_table('shopcart_version')
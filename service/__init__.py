@@ -3,23 +3,33 @@ Package: service
 Package for the application models and service routes
 This module creates and configures the Flask app and sets up the logging
 and SQL database
+
+Importing it has no side effects on the database: the tables are made by
+"flask db upgrade" and connections are only opened by requests, so the
+app can be preloaded by gunicorn before its workers fork.
 """
 import os
 import sys
 import logging
+from .utils.startup import StartupTimer
+
+startup = StartupTimer()
+
 from flask import Flask
 from .utils import log_handlers
 
-parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) 
-sys.path.insert(0,parentdir) 
+parentdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,parentdir)
 
 # Create Flask application
 app = Flask(__name__)
 app.config.from_object("config")
+startup.mark("config")
 
 # Import the routes After the Flask app is created
 from service import routes, models
-from .utils import error_handlers
+from .utils import error_handlers, metrics, query_stats
+startup.mark("routes")
 
 # Set up logging for production
 if __name__ != "__main__":
@@ -30,10 +40,17 @@ app.logger.info("  M Y   S E R V I C E   R U N N I N G  ".center(70, "*"))
 app.logger.info(70 * "*")
 
 try:
-    routes.init_db()  # make our sqlalchemy tables
+    routes.init_db()  # set up the sqlalchemy session, without connecting
 except Exception as error:
     app.logger.critical("%s: Cannot continue", error)
     # gunicorn requires exit code 4 to stop spawning workers when they die
     sys.exit(4)
+startup.mark("database")
+
+query_stats.init_app(app)
+metrics.init_metrics(app, lambda: models.Shopcart.cache, lambda: models.db.get_engine(app))
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=startup.forked)
 
-app.logger.info("Service initialized!")
+app.logger.info("Service initialized in %.3f seconds!", startup.total)
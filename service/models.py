@@ -13,14 +13,26 @@ quantity: quantity of an item
 price: price of an item
 hold: whether the item is on hold
 """
+import os
 import logging
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import (Boolean, Float, Integer, String, any_, bindparam, cast, column, func,
+                        literal, literal_column, select, union_all, values)
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from service.utils.cache import LRUCache
+from service.utils.db_pool import InstrumentedQueuePool
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
 db = SQLAlchemy()
 
+# Schema migrations, applied with "flask db upgrade"
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+migrate = Migrate()
+
 
 class DatabaseConnectionError(Exception):
     """Custom Exception when database connection fails"""
@@ -29,17 +41,44 @@ class DatabaseConnectionError(Exception):
 class DataValidationError(Exception):
     """ Used for an data validation errors when deserializing """
 
-    pass
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        # the per-field errors of the request body, when they are known
+        self.errors = errors
+
+
+class VersionMismatchError(Exception):
+    """ Used when a Shopcart is no longer at the version a request expects """
 
     
 
 
+# The operations of PATCH /shopcarts/<id>/items
+ITEM_OPERATIONS = ("add", "update", "delete", "hold")
+
+
+class ShopcartVersion(db.Model):
+    """
+    Class that represents the version of a Shopcart
+
+    It is moved on in the transaction of every change to the items of the
+    Shopcart and served as its ETag. A Shopcart without a row is at version 0.
+    """
+
+    __tablename__ = "shopcart_version"
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+
+
 class Shopcart(db.Model):
     """
     Class that represents a shopcart
     """
 
     app = None
+    # Per-worker cache of shopcart rows keyed by user_id, set up in init_db()
+    cache = LRUCache()
 
     # Shopcart-Item Table Schema
     user_id = db.Column(db.Integer, primary_key=True)
@@ -49,6 +88,10 @@ class Shopcart(db.Model):
     price = db.Column(db.Float)
     hold = db.Column(db.Boolean)
 
+    # The primary key index serves lookups by user_id, this one serves
+    # lookups by item_id and returns their user_ids already in order
+    __table_args__ = (db.Index("ix_shopcart_item_id_user_id", "item_id", "user_id"),)
+
     
     def __repr__(self):
         return "<Product %s in Shopcart for user %s>" % (self.item_id, self.user_id)
@@ -56,23 +99,99 @@ class Shopcart(db.Model):
     def create(self):
         """
         Creates a Shopcart to the database
+
+        Returns:
+            int: the new version of the Shopcart
         """
-        logger.info("Creating shopcart for user %s", self.user_id)
+        # read before the commit, so it does not reload the expired row
+        user_id = self.user_id
+        logger.info("Creating shopcart for user %s", user_id)
         db.session.add(self)
-        db.session.commit()
+        return Shopcart._commit(user_id)
     
-    def save(self):
+    def save(self, expected_version=None):
         """
         Updates a Shopcart to the database
+
+        Args:
+            expected_version (int): only save if the Shopcart is still at this version
+
+        Returns:
+            int: the new version of the Shopcart
         """
-        logger.info("Saving shopcart for user %s", self.user_id)
-        db.session.commit()
+        user_id = self.user_id
+        logger.info("Saving shopcart for user %s", user_id)
+        return Shopcart._commit(user_id, expected_version=expected_version)
 
-    def delete(self):
-        """ Removes a Shopcart from the data store """
-        logger.info("Deleting shopcart for user %s", self.user_id)
+    def delete(self, expected_version=None):
+        """
+        Removes a Shopcart from the data store
+
+        Args:
+            expected_version (int): only delete if the Shopcart is still at this version
+
+        Returns:
+            int: the new version of the Shopcart
+        """
+        user_id = self.user_id
+        logger.info("Deleting shopcart for user %s", user_id)
         db.session.delete(self)
-        db.session.commit()
+        return Shopcart._commit(user_id, expected_version=expected_version)
+
+    @classmethod
+    def _commit(cls, user_id, expected_version=None):
+        """ Commits the changes to a Shopcart made in the session """
+        try:
+            # write the items before their version, like every other change
+            db.session.flush()
+            version = cls._bump_versions(user_id, expected_version=expected_version)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache.invalidate(user_id)
+        return version
+
+    @classmethod
+    def _bump_versions(cls, *user_ids, expected_version=None):
+        """
+        Moves the versions of Shopcarts on in the transaction that changes them
+
+        With expected_version, the one Shopcart must still be at that version:
+        the check and the bump are one conditional statement, so no lock is
+        held between reading the version and writing.
+
+        Returns:
+            int: the new version of the last Shopcart
+        """
+        table = ShopcartVersion.__table__
+        if expected_version is None:
+            # in user_id order, so concurrent bumps of many Shopcarts cannot deadlock
+            stmt = insert(table).values(
+                [{"user_id": user_id, "version": 1} for user_id in sorted(set(user_ids))])
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c.user_id],
+                                              set_={"version": table.c.version + 1})
+        elif expected_version == 0:
+            stmt = insert(table).values(user_id=user_ids[0], version=1)
+            stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.user_id])
+        else:
+            stmt = table.update().where(
+                (table.c.user_id == user_ids[0]) & (table.c.version == expected_version)
+            ).values(version=table.c.version + 1)
+        versions = db.session.execute(stmt.returning(table.c.version)).scalars().all()
+        if not versions:
+            raise VersionMismatchError(
+                f"Shopcart with user_id '{user_ids[0]}' is no longer at version {expected_version}."
+            )
+        return versions[-1]
+
+    @classmethod
+    def get_version(cls, user_id):
+        """ Returns the version of a Shopcart without loading its items """
+        version = db.session.query(ShopcartVersion.version).filter(
+            ShopcartVersion.user_id == user_id
+        ).scalar()
+        return version or 0
 
     def serialize(self):
         """ Serializes a Shopcart into a dictionary """
@@ -143,15 +262,327 @@ class Shopcart(db.Model):
             )
         return self
 
+    @classmethod
+    def create_many(cls, items):
+        """
+        Creates a list of Shopcart items in a single transaction
+
+        Duplicate items are rejected before anything is written, then all
+        rows are sent in one executemany INSERT (batched into multi-row
+        INSERTs by psycopg2) and committed once. Nothing is kept on error.
+
+        Args:
+            items (list): Shopcart objects that are not in the database yet
+        """
+        logger.info("Creating %d shopcart items", len(items))
+        cls._check_duplicates(items)
+        if not items:
+            return items
+        try:
+            db.session.execute(cls.__table__.insert(), [item.serialize() for item in items])
+            cls._bump_versions(*(item.user_id for item in items))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache.invalidate(*{item.user_id for item in items})
+        return items
+
+    @classmethod
+    def replace_shopcart(cls, user_id, items):
+        """
+        Makes a Shopcart hold exactly the given items with the fewest writes
+
+        The stored rows are locked and compared with the items in one
+        transaction, then only the new items are inserted, the changed ones
+        updated and the missing ones deleted. Unchanged rows are not touched.
+
+        Args:
+            user_id (int): the Shopcart to replace
+            items (list): the Shopcart objects it should hold
+
+        Returns:
+            dict: how many items were inserted, updated, deleted and left unchanged
+        """
+        logger.info("Replacing shopcart for user %s with %d items", user_id, len(items))
+        cls._check_duplicates(items)
+        table = cls.__table__
+        fields = ("item_name", "quantity", "price", "hold")
+        try:
+            stored = {
+                row.item_id: row for row in db.session.execute(
+                    select(table).where(table.c.user_id == user_id).with_for_update()
+                )
+            }
+            desired = {item.item_id: item for item in items}
+            inserts = [item.serialize() for item_id, item in desired.items() if item_id not in stored]
+            updates = [
+                item for item_id, item in desired.items() if item_id in stored
+                and any(getattr(item, field) != getattr(stored[item_id], field) for field in fields)
+            ]
+            deletes = [item_id for item_id in stored if item_id not in desired]
+            if inserts:
+                # an item added since the rows were read is overwritten too
+                stmt = insert(table)
+                db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=[table.c.user_id, table.c.item_id],
+                    set_={field: stmt.excluded[field] for field in fields},
+                ), inserts)
+            if updates:
+                changes = values(column("item_id", Integer), column("item_name", String),
+                                 column("quantity", Integer), column("price", Float),
+                                 column("hold", Boolean), name="changes").data(
+                    [(item.item_id, item.item_name, item.quantity, item.price, item.hold)
+                     for item in updates])
+                db.session.execute(table.update().where(
+                    (table.c.user_id == user_id) & (table.c.item_id == changes.c.item_id)
+                ).values(
+                    item_name=cast(changes.c.item_name, String),
+                    quantity=cast(changes.c.quantity, Integer),
+                    price=cast(changes.c.price, Float),
+                    hold=cast(changes.c.hold, Boolean),
+                ))
+            if deletes:
+                db.session.execute(table.delete().where(
+                    (table.c.user_id == user_id) & table.c.item_id.in_(deletes)
+                ))
+            if inserts or updates or deletes:
+                cls._bump_versions(user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache.invalidate(user_id)
+        return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes),
+                "unchanged": len(desired) - len(inserts) - len(updates)}
+
+    @staticmethod
+    def _check_duplicates(items):
+        """ Rejects items that appear more than once """
+        seen = set()
+        for item in items:
+            key = (item.user_id, item.item_id)
+            if key in seen:
+                raise DataValidationError(
+                    f"Item with id '{item.item_id}' appears more than once in the data."
+                )
+            seen.add(key)
+
+    @classmethod
+    def upsert(cls, item):
+        """
+        Adds an item to a Shopcart, or adds its quantity to the item already there
+
+        One INSERT ... ON CONFLICT DO UPDATE statement, so concurrent adds of
+        the same item cannot race between a lookup and the insert.
+
+        Args:
+            item (Shopcart): the item to add
+
+        Returns:
+            (Shopcart, bool): the stored item and whether it was inserted
+        """
+        logger.info("Upserting item %s in shopcart for user %s", item.item_id, item.user_id)
+        table = cls.__table__
+        stmt = insert(table).values(**item.serialize())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.item_id],
+            set_={"quantity": table.c.quantity + stmt.excluded.quantity},
+        ).returning(*table.c, literal_column("xmax = 0").label("inserted"))
+        try:
+            row = db.session.execute(stmt).one()
+            cls._bump_versions(item.user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache.invalidate(item.user_id)
+        # xmax is only set on a row version made by the UPDATE branch
+        stored = cls(**{column.name: row._mapping[column.name] for column in table.c})
+        return stored, row.inserted
+
+    @classmethod
+    def set_hold(cls, user_id, hold, item_ids=None):
+        """
+        Holds or resumes the items of a Shopcart with a single UPDATE
+
+        Args:
+            user_id (int): the Shopcart to update
+            hold (bool): the new holding status
+            item_ids (list): only these items, all of the Shopcart if None
+
+        Returns:
+            list: the updated items in item_id order
+        """
+        logger.info("Setting hold to %s for items %s in shopcart for user %s", hold, item_ids, user_id)
+        table = cls.__table__
+        stmt = table.update().where(table.c.user_id == user_id)
+        if item_ids is not None:
+            stmt = stmt.where(table.c.item_id.in_(item_ids))
+        stmt = stmt.values(hold=hold).returning(*table.c)
+        try:
+            rows = db.session.execute(stmt).all()
+            if rows:
+                cls._bump_versions(user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache.invalidate(user_id)
+        return sorted((cls(**row._mapping) for row in rows), key=lambda item: item.item_id)
+
+    @classmethod
+    def apply_operations(cls, user_id, operations):
+        """
+        Applies an ordered list of item operations to a Shopcart in one transaction
+
+        Consecutive operations of the same kind on distinct items are sent as
+        one set-based statement. Nothing is kept unless every operation applies.
+
+        Args:
+            user_id (int): the Shopcart to change
+            operations (list): (op, item_id, value) tuples, where value is the
+                Shopcart to insert for "add", a dict with the new quantity and/or
+                price for "update", the holding status for "hold" and None for "delete"
+
+        Returns:
+            (bool, list): whether the operations were committed, and the
+            (status_code, item) each one got, item being None when there is none
+        """
+        logger.info("Applying %d operations to shopcart for user %s", len(operations), user_id)
+        results = []
+        try:
+            for op, run in cls._operation_runs(operations):
+                rows = {row.item_id: row for row in getattr(cls, "_run_" + op)(user_id, run)}
+                for _, item_id, _ in run:
+                    row = rows.get(item_id)
+                    if op == "delete":
+                        results.append((204, None))
+                    elif row is None:
+                        results.append((409 if op == "add" else 404, None))
+                    else:
+                        results.append((201 if op == "add" else 200, cls(**row._mapping)))
+            applied = all(code < 400 for code, _ in results)
+            if applied:
+                cls._bump_versions(user_id)
+                db.session.commit()
+            else:
+                db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            raise
+        if applied:
+            cls.cache.invalidate(user_id)
+        return applied, results
+
+    @staticmethod
+    def _operation_runs(operations):
+        """ Splits operations into runs of one kind on distinct items, in order """
+        run, item_ids = [], set()
+        for operation in operations:
+            op, item_id, value = operation
+            if run and (op != run[0][0] or item_id in item_ids
+                        or (op == "hold" and value != run[0][2])):
+                yield run[0][0], run
+                run, item_ids = [], set()
+            run.append(operation)
+            item_ids.add(item_id)
+        if run:
+            yield run[0][0], run
+
+    @classmethod
+    def _run_add(cls, user_id, run):
+        """ Inserts the items that are not in the Shopcart yet """
+        table = cls.__table__
+        stmt = insert(table).values([item.serialize() for _, _, item in run])
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.item_id])
+        return db.session.execute(stmt.returning(*table.c)).all()
+
+    @classmethod
+    def _run_update(cls, user_id, run):
+        """ Updates the quantity and/or price of items from a VALUES list """
+        table = cls.__table__
+        changes = values(column("item_id", Integer), column("quantity", Integer),
+                         column("price", Float), name="changes").data(
+            [(item_id, value.get("quantity"), value.get("price")) for _, item_id, value in run])
+        stmt = table.update().where(
+            (table.c.user_id == user_id) & (table.c.item_id == changes.c.item_id)
+        ).values(
+            quantity=func.coalesce(cast(changes.c.quantity, Integer), table.c.quantity),
+            price=func.coalesce(cast(changes.c.price, Float), table.c.price),
+        )
+        return db.session.execute(stmt.returning(*table.c)).all()
+
+    @classmethod
+    def _run_delete(cls, user_id, run):
+        """ Deletes the items """
+        table = cls.__table__
+        stmt = table.delete().where(
+            (table.c.user_id == user_id) & table.c.item_id.in_([item_id for _, item_id, _ in run])
+        )
+        return db.session.execute(stmt.returning(table.c.item_id)).all()
+
+    @classmethod
+    def _run_hold(cls, user_id, run):
+        """ Sets the same holding status on the items """
+        table = cls.__table__
+        stmt = table.update().where(
+            (table.c.user_id == user_id) & table.c.item_id.in_([item_id for _, item_id, _ in run])
+        ).values(hold=run[0][2])
+        return db.session.execute(stmt.returning(*table.c)).all()
+
+    @classmethod
+    def delete_shopcart(cls, user_id):
+        """
+        Removes every item of a Shopcart with a single DELETE
+
+        Returns:
+            int: the number of items that were deleted
+        """
+        logger.info("Deleting all items in shopcart for user %s", user_id)
+        try:
+            count = cls.query.filter(cls.user_id == user_id).delete(synchronize_session=False)
+            if count:
+                cls._bump_versions(user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache.invalidate(user_id)
+        return count
+
     @classmethod
     def init_db(cls, app):
-        """ Initializes the database session """
+        """
+        Initializes the database session
+
+        Nothing connects to the database here, so the app can be imported
+        and preloaded before workers fork. The tables are made by the
+        migrations ("flask db upgrade"), or by db.create_all() in tests.
+        """
         logger.info("Initializing database")
         cls.app = app
+        cls.cache = LRUCache(app.config.get("SHOPCART_CACHE_SIZE", 0),
+                             app.config.get("SHOPCART_CACHE_TTL", 30.0))
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        options.setdefault("poolclass", InstrumentedQueuePool)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
-        app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        migrate.init_app(app, db, directory=MIGRATIONS_DIR)
+
+    @classmethod
+    def dispose_pool(cls):
+        """
+        Drops the pooled connections inherited from a parent process
+
+        They are dropped without being closed, as closing them would also
+        end the sessions the parent process still uses.
+        """
+        if cls.app is None:
+            return
+        db.get_engine(cls.app).dispose(close=False)
+        cls.cache.clear()
 
     @classmethod
     def all(cls):
@@ -160,16 +591,93 @@ class Shopcart(db.Model):
         return cls.query.all()
     
     @classmethod
-    def all_shopcart(cls):
-        """ Returns all of the non-empty Shopcarts in the database """
+    def all_shopcart(cls, limit=None, after=None):
+        """
+        Returns the non-empty Shopcarts in the database in user_id order
+
+        Args:
+            limit (int): the most Shopcarts to return, all of them if None
+            after (int): only return Shopcarts with a larger user_id
+        """
         logger.info("Processing all Shopcarts")
-        return cls.query.with_entities(cls.user_id).distinct().all()
+        return cls._keyset_page(cls._user_ids(), limit, after).all()
     
     @classmethod
-    def find_shopcart(cls, user_id):
-        """ Finds a shopcart (including items it has) by user_id """
+    def find_shopcart(cls, user_id, cached=True):
+        """
+        Finds a shopcart (including items it has) by user_id
+
+        Items served from the cache are not in the session and are read-only,
+        pass cached=False to load items that will be changed
+        """
         logger.info("Processing lookup for user id %s...", user_id)
-        return cls.query.filter(cls.user_id == user_id).all()
+        rows = cls._cached_rows(user_id) if cached else None
+        if rows is not None:
+            return [cls._from_cache(row) for row in rows.values()]
+        return cls._load_shopcart(user_id)
+
+    @classmethod
+    def find_shopcart_at(cls, user_id, version):
+        """
+        Finds a shopcart whose version was just read with get_version()
+
+        The cache is only used when it holds that very version, so the items
+        are never older than the ETag they are sent with.
+        """
+        logger.info("Processing lookup for user id %s at version %s...", user_id, version)
+        entry = cls.cache.get(user_id)
+        if entry is not None and entry[0] == version:
+            return [cls._from_cache(row) for row in entry[1].values()]
+        return cls._load_shopcart(user_id, version)
+
+    @classmethod
+    def _load_shopcart(cls, user_id, version=None):
+        """ Reads a shopcart from the database and caches it with its version (if known) """
+        token = cls.cache.token()
+        items = cls.query.filter(cls.user_id == user_id).all()
+        cls.cache.set(user_id, (version, {item.item_id: item.serialize() for item in items}), token)
+        return items
+
+    @classmethod
+    def _cached_rows(cls, user_id):
+        """ Returns the cached rows of a shopcart by item_id, None on a miss """
+        entry = cls.cache.get(user_id)
+        return entry[1] if entry is not None else None
+
+    @classmethod
+    def find_shopcarts(cls, user_ids, chunk_size=1000):
+        """
+        Finds many shopcarts (including items they have) by user_id
+
+        Shopcarts in the cache are served from it, the others are read with
+        one "user_id = ANY(:ids)" query per chunk_size user ids.
+
+        Returns:
+            dict: the items of each user_id in item_id order, empty when it has none
+        """
+        logger.info("Processing lookup for %d user ids...", len(user_ids))
+        shopcarts = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            rows = cls._cached_rows(user_id)
+            if rows is None:
+                missing.append(user_id)
+            else:
+                shopcarts[user_id] = sorted((cls._from_cache(row) for row in rows.values()),
+                                            key=lambda item: item.item_id)
+        ids = bindparam("ids", type_=ARRAY(Integer))
+        query = cls.query.filter(cls.user_id == any_(ids)).order_by(cls.user_id, cls.item_id)
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            token = cls.cache.token()
+            found = {user_id: [] for user_id in chunk}
+            for item in query.params(ids=chunk):
+                found[item.user_id].append(item)
+            for user_id, items in found.items():
+                cls.cache.set(user_id, (None, {item.item_id: item.serialize() for item in items}), token)
+            shopcarts.update(found)
+        # in the order they were asked for
+        return {user_id: shopcarts[user_id] for user_id in dict.fromkeys(user_ids)}
 
     @classmethod
     def find_shopcart_or_404(cls, user_id):
@@ -179,11 +687,56 @@ class Shopcart(db.Model):
     
 
     @classmethod
-    def find_item(cls, user_id, item_id):
-        """ Finds an item by user_id and item_id """
+    def find_item(cls, user_id, item_id, cached=True):
+        """
+        Finds an item by user_id and item_id
+
+        An item served from the cache is not in the session and is read-only,
+        pass cached=False to load an item that will be changed
+        """
         logger.info("Processing lookup for user id %s item id %s...", user_id, item_id)
+        rows = cls._cached_rows(user_id) if cached else None
+        if rows is not None:
+            row = rows.get(item_id)
+            return cls._from_cache(row) if row else None
         return cls.query.filter((cls.user_id == user_id) & (cls.item_id == item_id)).first()
 
+    @classmethod
+    def find_item_in_shopcart(cls, user_id, item_id, cached=True):
+        """
+        Finds an item and tells a missing Shopcart from a missing item
+
+        One statement does both: the item row UNION ALL any one row of the
+        Shopcart, each an index lookup, with the item first when it exists.
+
+        Returns:
+            (bool, Shopcart): whether the Shopcart has any items, and the item or None
+        """
+        logger.info("Processing lookup for user id %s item id %s...", user_id, item_id)
+        rows = cls._cached_rows(user_id) if cached else None
+        if rows is not None:
+            row = rows.get(item_id)
+            return bool(rows), cls._from_cache(row) if row else None
+        table = cls.__table__
+        in_cart = table.c.user_id == user_id
+        found = select(table, literal(True).label("found")).where(in_cart & (table.c.item_id == item_id))
+        other = select(table, literal(False).label("found")).where(in_cart).limit(1)
+        rows = union_all(found, other).subquery()
+        row = db.session.query(aliased(cls, rows), rows.c.found).order_by(rows.c.found.desc()).first()
+        if row is None:
+            return False, None
+        return True, row[0] if row.found else None
+
+    @classmethod
+    def _from_cache(cls, row):
+        """
+        Builds a read-only item from a cached row
+
+        It is never merged into the session: a row deleted or changed by
+        another worker within the TTL would otherwise be written back blindly
+        """
+        return cls(**row)
+
 
     @classmethod
     def find_item_or_404(cls, user_id, item_id):
@@ -192,7 +745,54 @@ class Shopcart(db.Model):
         return cls.query.filter((cls.user_id == user_id) & (cls.item_id == item_id)).first_or_404()
 
     @classmethod
-    def query_by_item_id(cls, item_id):
-        """ Find all shopcarts containing the item_id """
+    def query_by_item_id(cls, item_id, limit=None, after=None):
+        """
+        Find all shopcarts containing the item_id in user_id order
+
+        Args:
+            item_id (int): the item the Shopcarts must contain
+            limit (int): the most Shopcarts to return, all of them if None
+            after (int): only return Shopcarts with a larger user_id
+        """
         logger.info("Processing lookup for all shopcarts containing item id %s...", item_id)
-        return cls.query.filter(cls.item_id == item_id).with_entities(cls.user_id).all()
+        return cls._keyset_page(cls._user_ids(item_id), limit, after).all()
+
+    @classmethod
+    def iter_user_ids(cls, item_id=None, after=None, chunk_size=1000):
+        """
+        Yields the user_ids of the non-empty Shopcarts in user_id order
+
+        The rows come from a server-side cursor chunk_size at a time, so
+        memory stays flat however many Shopcarts there are.
+
+        Args:
+            item_id (int): only Shopcarts containing this item, all if None
+            after (int): only Shopcarts with a larger user_id
+            chunk_size (int): how many rows are fetched per round trip
+        """
+        logger.info("Streaming shopcarts containing item id %s...", item_id)
+        query = cls._keyset_page(cls._user_ids(item_id), None, after).yield_per(chunk_size)
+        for row in query:
+            yield row.user_id
+
+    @classmethod
+    def _user_ids(cls, item_id=None):
+        """ Returns a query of the user_ids of Shopcarts (containing item_id) """
+        if item_id is None:
+            return cls.query.with_entities(cls.user_id).distinct()
+        return cls.query.filter(cls.item_id == item_id).with_entities(cls.user_id)
+
+    @classmethod
+    def _keyset_page(cls, query, limit, after):
+        """ Restricts a query on user_id to the page after the given user_id """
+        if after is not None:
+            query = query.filter(cls.user_id > after)
+        query = query.order_by(cls.user_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+
+# A worker forked from a preloaded app must not share the parent's connections
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Shopcart.dispose_pool)
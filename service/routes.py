@@ -8,14 +8,20 @@ for documentation.
 """
 from attr import validate
 from isort import code
-from werkzeug.exceptions import NotFound
-from flask import jsonify, request, url_for, make_response, abort
+from werkzeug.http import quote_etag
+from flask import jsonify, request, url_for, make_response, abort, Response, stream_with_context
 from flask_restx import Api, Resource, fields, reqparse, inputs
-from service.models import Shopcart, DataValidationError, DatabaseConnectionError
+from service.models import Shopcart, DataValidationError, DatabaseConnectionError, VersionMismatchError, ITEM_OPERATIONS, db
 from .utils import status  # HTTP Status Codes
+from .utils.db_pool import pool_status
+from .utils import metrics
+from .utils.streaming import stream_json_array
+from .utils.serializers import compile_serializer
+from .utils.json_encoding import get_encoder
+from .utils.validation import compile_validator, describe_errors
 
 # Import Flask application
-from . import app
+from . import app, startup
 
 ######################################################################
 # GET INDEX
@@ -26,6 +32,26 @@ def index():
     app.logger.info("Root URL response")
     return app.send_static_file("index.html")
 
+######################################################################
+# GET STATS
+######################################################################
+@app.route("/stats")
+def stats():
+    """ Returns the connection pool, cache and startup statistics of this worker """
+    return jsonify(pool=pool_status(db.engine.pool), cache=Shopcart.cache.stats(),
+                   startup=startup.snapshot()), status.HTTP_200_OK
+
+######################################################################
+# GET METRICS
+######################################################################
+@app.route("/metrics")
+def get_metrics():
+    """ Returns the Prometheus metrics of all of the workers """
+    if not metrics.enabled():
+        abort(status.HTTP_501_NOT_IMPLEMENTED, "Metrics need prometheus_client to be installed.")
+    body, content_type = metrics.render()
+    return Response(body, status=status.HTTP_200_OK, content_type=content_type)
+
 ######################################################################
 # Configure Swagger before initializing it
 ######################################################################
@@ -53,8 +79,8 @@ create_item_model = api.model('Item', {
                           description='The price of the Item',
                           min = 0,
                           exclusiveMin = True),
-    'hold': fields.Boolean(required=True,
-                            description='The holding status of the Item')
+    'hold': fields.Boolean(description='The holding status of the Item',
+                           default=False)
 })
 
 # Define the model so that the docs reflect what can be sent
@@ -75,6 +101,16 @@ create_shopcart_model = api.model('Shopcart', {
                          description='The list of Items (use for multiple items)')
 })
 
+user_ids_model = api.model('UserIds', {
+    'user_ids': fields.List(fields.Integer(min = 0), required=True,
+                            description='The IDs of the users whose Shopcarts are returned')
+})
+
+replace_shopcart_model = api.model('ShopcartItems', {
+    'items': fields.List(fields.Nested(create_item_model), required=True,
+                         description='Every Item the Shopcart should hold')
+})
+
 item_model = api.model('ItemModel', {
     'user_id': fields.Integer(readOnly=True,
                               description='The ID of the User',
@@ -92,7 +128,7 @@ item_model = api.model('ItemModel', {
     'hold': fields.Boolean(description='The holding status of the Item')
 })
 
-update_item_model = api.model('ItemModel', {
+update_item_model = api.model('UpdateItemModel', {
     'quantity': fields.Integer(description='The quantity of the Item',
                                min = 1),
     'price': fields.Float(description='The price of the Item',
@@ -100,12 +136,43 @@ update_item_model = api.model('ItemModel', {
                           exclusiveMin = True)       
 })
 
-update_item_model = api.model('ItemModel', {
-    'quantity': fields.Integer(description='The quantity of the Item',
+item_ids_model = api.model('ItemIds', {
+    'item_ids': fields.List(fields.Integer(min = 0),
+                            description='The IDs of the Items (all Items of the Shopcart if missing)')
+})
+
+item_operation_model = api.model('ItemOperation', {
+    'op': fields.String(required=True,
+                        description='The operation on the Item',
+                        enum=ITEM_OPERATIONS),
+    'item_id': fields.Integer(required=True,
+                              description='The ID of the Item',
+                              min = 0),
+    'item_name': fields.String(description='The name of the Item (add)'),
+    'quantity': fields.Integer(description='The quantity of the Item (add, update)',
                                min = 1),
-    'price': fields.Float(description='The price of the Item',
+    'price': fields.Float(description='The price of the Item (add, update)',
                           min = 0,
-                          exclusiveMin = True)       
+                          exclusiveMin = True),
+    'hold': fields.Boolean(description='The holding status of the Item (add, hold defaults to true)')
+})
+
+item_operation_result_model = api.model('ItemOperationResult', {
+    'op': fields.String(readOnly=True,
+                        description='The operation on the Item'),
+    'item_id': fields.Integer(readOnly=True,
+                              description='The ID of the Item'),
+    'status_code': fields.Integer(readOnly=True,
+                                  description='The status the operation would get as its own request'),
+    'item': fields.Nested(item_model, allow_null=True,
+                          description='The Item after the operation')
+})
+
+shopcart_items_model = api.model('ShopcartItemsModel', {
+    'user_id': fields.Integer(readOnly=True,
+                              description='The ID of the User'),
+    'items': fields.List(fields.Nested(item_model), readOnly=True,
+                         description='The Items in the Shopcart')
 })
 
 list_shopcart_model = api.model('ShopcartModel', {
@@ -113,9 +180,38 @@ list_shopcart_model = api.model('ShopcartModel', {
                               description='The ID of the User')
 })
 
+# Responses are built straight into the shape of their models, instead of
+# building dicts and then walking them again with marshal()
+serialize_item = compile_serializer(item_model)
+serialize_shopcart = compile_serializer(list_shopcart_model)
+
+# Request bodies are checked against the same models, compiled once
+validate_item = compile_validator(create_item_model)
+validate_update = compile_validator(update_item_model, require_any=True)
+validate_operation = compile_validator(item_operation_model)
+
 # query string arguments
 shopcart_args = reqparse.RequestParser()
 shopcart_args.add_argument('item-id', type=int, required=False, help='Optional, to list shopcarts containing the item id')
+shopcart_args.add_argument('limit', type=inputs.positive, required=False, help='Optional, the most shopcarts to return in one page (defaults to SHOPCART_PAGE_SIZE)')
+shopcart_args.add_argument('after', type=int, required=False, help='Optional, only list shopcarts with a larger user id (the cursor of the next page)')
+shopcart_args.add_argument('stream', type=inputs.boolean, default=False, help='Optional, stream every shopcart after the cursor in one response instead of a page')
+
+item_args = reqparse.RequestParser()
+item_args.add_argument('merge', type=inputs.boolean, default=False, location='args', help='Optional, add the quantity to the item if it is already in the cart')
+
+######################################################################
+# JSON Representation
+######################################################################
+encode_json = get_encoder(app.config.get("JSON_ENCODER", "auto"))
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    """ Writes the responses of the API with the configured JSON encoder """
+    response = make_response(encode_json(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
 
 ######################################################################
 # Special Error Handlers
@@ -125,11 +221,25 @@ def request_validation_error(error):
     """ Handles Value Errors from bad data """
     message = str(error)
     app.logger.error(message)
-    return {
+    body = {
         'status_code': status.HTTP_400_BAD_REQUEST,
         'error': 'Bad Request',
         'message': message
-    }, status.HTTP_400_BAD_REQUEST
+    }
+    if error.errors:
+        body['errors'] = error.errors
+    return body, status.HTTP_400_BAD_REQUEST
+
+@api.errorhandler(VersionMismatchError)
+def version_mismatch_error(error):
+    """ Handles changes made with an If-Match that no longer matches """
+    message = str(error)
+    app.logger.warning(message)
+    return {
+        'status_code': status.HTTP_412_PRECONDITION_FAILED,
+        'error': 'Precondition Failed',
+        'message': message
+    }, status.HTTP_412_PRECONDITION_FAILED
 
 # @api.errorhandler(DatabaseConnectionError)
 # def database_connection_error(error):
@@ -154,9 +264,8 @@ class ShopcartCollection(Resource):
     @api.doc('create_shopcarts')
     @api.response(400, 'Invalid posted data')
     @api.response(409, 'Non-empty shopcart already exists at this id')
-    @api.response(201, 'Created shopcart')
+    @api.response(201, 'Created shopcart', [item_model])
     @api.expect(create_shopcart_model)
-    @api.marshal_list_with(item_model, code=201)
     def post(self):
         """
         Creates a Shopcart
@@ -174,31 +283,15 @@ class ShopcartCollection(Resource):
                 f"User with id '{user_id}' already has a non-empty shopcart.",
             )
         
-        shopcarts = []
-        shopcarts_deserialize = []
-        if "items" in req.keys():
-            shopcarts = req["items"]
+        items = check_items(validate_item, req.get("items", []))
         if "item_id" in req.keys():
-            shopcarts.append(req)
-        for s in shopcarts:
-            s["user_id"] = req["user_id"]
-            shopcart = Shopcart()
-            shopcart.deserialize(s)
-            shopcarts_deserialize.append(shopcart)
-        for s in shopcarts_deserialize:
-            if Shopcart.find_item(req["user_id"], s.item_id):
-                shopcart = Shopcart.find_shopcart(req["user_id"]) 
-                if shopcart:
-                    for item in shopcart:
-                        item.delete()
-                abort(
-                status.HTTP_400_BAD_REQUEST, 
-                f"Item with id '{s.item_id}' appears more than once in the data.",
-            )
-            s.create()
+            items.append(check_item(validate_item, req))
+        shopcarts_deserialize = [Shopcart(user_id=req["user_id"], **item) for item in items]
+        # all items go in with one INSERT, duplicates are rejected before it
+        Shopcart.create_many(shopcarts_deserialize)
         location_url = api.url_for(ShopcartResource, user_id=req["user_id"], _external=True)
         app.logger.info("Shopcart with ID [%s] created.", req["user_id"])
-        results = [shopcart.serialize() for shopcart in shopcarts_deserialize]
+        results = [serialize_item(shopcart) for shopcart in shopcarts_deserialize]
         return results, status.HTTP_201_CREATED, {"Location": location_url}
 
     ######################################################################
@@ -206,23 +299,81 @@ class ShopcartCollection(Resource):
     ######################################################################
     @api.doc('list_shopcarts')
     @api.expect(shopcart_args, validate=True)
-    @api.response(200, 'Listed all shopcarts')
-    @api.marshal_list_with(list_shopcart_model)
+    @api.response(200, 'Listed all shopcarts', [list_shopcart_model])
     def get(self):
-        """Returns all of the Shopcarts OR only those with the given item-id"""
+        """
+        Returns all of the Shopcarts OR only those with the given item-id
+        The Shopcarts are returned one page at a time in user_id order, and
+        the Link header points to the next page when there may be one.
+        With stream=true all of them are sent in one chunked response instead
+        """
         app.logger.info("Request for shopcart list")
         args = shopcart_args.parse_args()
-        if args['item-id']:
+        if args['stream']:
+            chunk_size = app.config["SHOPCART_STREAM_CHUNK_SIZE"]
+            user_ids = Shopcart.iter_user_ids(args['item-id'], args['after'], chunk_size)
+            rows = ({'user_id': user_id} for user_id in user_ids)
+            # the request context keeps the session open until the last chunk
+            return Response(stream_with_context(stream_json_array(rows, chunk_size)),
+                            status=status.HTTP_200_OK, mimetype="application/json")
+        limit = min(args['limit'] or app.config["SHOPCART_PAGE_SIZE"],
+                    app.config["SHOPCART_PAGE_SIZE_MAX"])
+        if args['item-id'] is not None:
             app.logger.info("Filtering shopcarts by item id %s", args['item-id'])
-            shopcarts = Shopcart.query_by_item_id(args['item-id'])
+            shopcarts = Shopcart.query_by_item_id(args['item-id'], limit, args['after'])
         else:
             app.logger.info("Returning unfiltered shopcart lists")
-            shopcarts = Shopcart.all_shopcart()
+            shopcarts = Shopcart.all_shopcart(limit, args['after'])
 
-        results = [dict(shopcart) for shopcart in shopcarts]
+        results = [serialize_shopcart(shopcart) for shopcart in shopcarts]
         app.logger.info("Returning %d shopcarts", len(results))
-        return results, status.HTTP_200_OK
+        headers = {}
+        if len(results) == limit:
+            params = {'limit': limit, 'after': results[-1]['user_id']}
+            if args['item-id'] is not None:
+                params['item-id'] = args['item-id']
+            next_url = api.url_for(ShopcartCollection, _external=True, **params)
+            headers['Link'] = f'<{next_url}>; rel="next"'
+        return results, status.HTTP_200_OK, headers
+
+
+
+######################################################################
+#  PATH: /shopcarts/search
+######################################################################
+@api.route('/shopcarts/search', strict_slashes=False)
+class ShopcartSearchResource(Resource):
 
+    ######################################################################
+    # RETRIEVE MANY SHOPCARTS
+    ######################################################################
+    @api.doc('search_shopcarts')
+    @api.response(400, 'Invalid or too many user ids')
+    @api.response(200, 'Retrieved shopcarts', [shopcart_items_model])
+    @api.expect(user_ids_model)
+    def post(self):
+        """
+        Retrieve many Shopcarts at once
+        The Shopcarts of the posted user_ids are returned in that order, each
+        with its items (none for an empty Shopcart). The ids are sent in the
+        body as a long list would not fit in a URL
+        """
+        check_content_type("application/json")
+        req = request.get_json()
+        user_ids = req.get("user_ids") if isinstance(req, dict) else None
+        if not isinstance(user_ids, list) or not all(
+                isinstance(user_id, int) and not isinstance(user_id, bool) and user_id >= 0
+                for user_id in user_ids):
+            abort(status.HTTP_400_BAD_REQUEST, "user_ids must be a list of non-negative integers.")
+        if len(user_ids) > app.config["SHOPCART_SEARCH_MAX"]:
+            abort(status.HTTP_400_BAD_REQUEST,
+                  f"At most {app.config['SHOPCART_SEARCH_MAX']} user ids are accepted at once.")
+        app.logger.info("Request for %d shopcarts", len(user_ids))
+        shopcarts = Shopcart.find_shopcarts(user_ids, app.config["SHOPCART_SEARCH_CHUNK_SIZE"])
+        return [
+            {'user_id': user_id, 'items': [serialize_item(item) for item in items]}
+            for user_id, items in shopcarts.items()
+        ], status.HTTP_200_OK
 
 
 ######################################################################
@@ -235,24 +386,52 @@ class ShopcartResource(Resource):
     ######################################################################
     # RETRIEVE A SHOPCART
     ######################################################################
-    @api.doc('get_shopcarts')
-    @api.marshal_list_with(item_model)
-    @api.response(200, 'Retrieved shopcart')
+    @api.doc('get_shopcarts', params={'If-None-Match': {'in': 'header', 'description': 'The ETag of the copy the client holds'}})
+    @api.response(200, 'Retrieved shopcart', [item_model])
+    @api.response(304, 'Shopcart not modified since the ETag in If-None-Match')
     def get(self, user_id):
         """
         Retrieve a single Shopcart
-        This endpoint will return a Shopcart based on its id
+        This endpoint will return a Shopcart based on its id, with its version
+        as the ETag. Only the version is read when it matches If-None-Match
         """
         app.logger.info("Request for shopcart with id: %s", user_id)
-        
-        #This is the list of shopcarts which user_id == shopcart_id
-        shopcart = Shopcart.find_shopcart(user_id)         
-        if not shopcart:
-            return [], status.HTTP_200_OK 
+        version = Shopcart.get_version(user_id)
+        # clients must revalidate, which costs a single primary key lookup
+        headers = {'ETag': quote_etag(str(version)), 'Cache-Control': 'no-cache'}
+        if request.if_none_match.contains_weak(str(version)):
+            app.logger.info("Shopcart %s not modified", user_id)
+            return make_response("", status.HTTP_304_NOT_MODIFIED, headers)
 
+        #This is the list of shopcarts which user_id == shopcart_id
+        shopcart = Shopcart.find_shopcart_at(user_id, version)
         app.logger.info("Returning shopcart: %s", user_id)
         #As 1 user is attached to 1 user_id
-        return [sc.serialize() for sc in shopcart], status.HTTP_200_OK
+        return [serialize_item(sc) for sc in shopcart], status.HTTP_200_OK, headers
+
+
+    ######################################################################
+    # REPLACE A SHOPCART
+    ######################################################################
+    @api.doc('replace_shopcarts')
+    @api.response(400, 'Invalid posted data')
+    @api.response(200, 'Replaced shopcart', [item_model])
+    @api.expect(replace_shopcart_model)
+    def put(self, user_id):
+        """
+        Replace the items of a single Shopcart
+        Only the items that differ from the stored ones are written
+        """
+        app.logger.info("Request to replace shopcart with id: %s", user_id)
+        check_content_type("application/json")
+        req = request.get_json()
+        if not isinstance(req, dict) or "items" not in req:
+            abort(status.HTTP_400_BAD_REQUEST, "The body must have a list of items.")
+        items = [Shopcart(user_id=user_id, **item) for item in check_items(validate_item, req["items"])]
+        counts = Shopcart.replace_shopcart(user_id, items)
+        app.logger.info("Replaced shopcart %s: %s", user_id, counts)
+        items.sort(key=lambda item: item.item_id)
+        return [serialize_item(item) for item in items], status.HTTP_200_OK
 
 
     ######################################################################
@@ -265,11 +444,8 @@ class ShopcartResource(Resource):
         Delete a single Shopcart
         """
         app.logger.info("Request to delete shopcart with id: %s", user_id)
-        
-        shopcart = Shopcart.find_shopcart(user_id) 
-        if shopcart:
-            for item in shopcart:
-                item.delete()
+        count = Shopcart.delete_shopcart(user_id)
+        app.logger.info("Deleted %d items from shopcart %s", count, user_id)
         return "", status.HTTP_204_NO_CONTENT
 
 
@@ -284,43 +460,29 @@ class ItemCollectionResource(Resource):
     # CREATE AN ITEM
     ######################################################################
     @api.doc('create_items')
-    @api.response(201, 'created')
+    @api.response(201, 'created', item_model)
+    @api.response(200, 'quantity added to the item already in cart (merge=true)', item_model)
     @api.response(409, 'item already in cart')
     @api.response(400, 'invalid attributes')
-    @api.expect(create_item_model)
-    @api.marshal_with(item_model, code=201)
+    @api.expect(create_item_model, item_args)
     def post(self, shopcart_id):
         """
         Create new item in shopcart {shopcart_id}.
-        This endpoint will create an item based the data in the body that is posted
+        This endpoint will create an item based the data in the body that is posted.
+        With merge=true an item already in the cart gets the posted quantity added
         """
+        args = item_args.parse_args()
         check_content_type("application/json")
         item = request.get_json()
         app.logger.info("Received item %s...", item)
 
-        try:
-            assert isinstance(item["quantity"], int)
-            assert item["quantity"] > 0
-        except:
-            app.logger.error("Quantity must be a positive integer.")
-            abort(status.HTTP_400_BAD_REQUEST, "Quantity must be a positive integer.")
-        try:
-            assert isinstance(item["item_id"], int)
-            assert item["item_id"] >= 0
-        except (TypeError, AssertionError, KeyError):
-            app.logger.error("Item_id must be a non-negative integer.")
-            abort(status.HTTP_400_BAD_REQUEST, "Item_id must be a non-negative integer.")
-        try:
-            assert isinstance(item["item_name"], str)
-        except (AssertionError, KeyError):
-            app.logger.error("Item_name must be a string.")
-            abort(status.HTTP_400_BAD_REQUEST, "Item_name must be a string.")
-        try:
-            assert isinstance(item["price"], int) or isinstance(item["price"], float)
-            assert item["price"] > 0
-        except (TypeError, AssertionError, KeyError):
-            app.logger.error("Price must be a positive int or float.")
-            abort(status.HTTP_400_BAD_REQUEST, "Price must be a positive int or float.")
+        item = check_item(validate_item, item)
+
+        if args['merge']:
+            new_item, created = Shopcart.upsert(Shopcart(user_id=shopcart_id, **item))
+            app.logger.info("Item %s in shopcart %s %s", item["item_id"], shopcart_id,
+                            "created" if created else "merged")
+            return serialize_item(new_item), status.HTTP_201_CREATED if created else status.HTTP_200_OK
 
         if Shopcart.find_item(shopcart_id, item["item_id"]):
             item_id = item["item_id"]
@@ -328,15 +490,38 @@ class ItemCollectionResource(Resource):
                 status.HTTP_409_CONFLICT, 
                 f"Shopcart with user_id '{shopcart_id}' already contains item with id '{item_id}'. Do you mean Update?"
             )
-        item["user_id"] = shopcart_id
         app.logger.info(
             "Creating item %s with user_id %s, item_name %s, price %s, quantity %s...",
-            item["item_id"], item["user_id"], item["item_name"], item["price"], item["quantity"]
+            item["item_id"], shopcart_id, item["item_name"], item["price"], item["quantity"]
         )    
-        new_item = Shopcart()
-        new_item.deserialize(item)
+        new_item = Shopcart(user_id=shopcart_id, **item)
         new_item.create()
-        return new_item.serialize(), status.HTTP_201_CREATED
+        return serialize_item(new_item), status.HTTP_201_CREATED
+
+    ######################################################################
+    # APPLY A BATCH OF ITEM OPERATIONS
+    ######################################################################
+    @api.doc('patch_items')
+    @api.response(200, 'all operations applied', [item_operation_result_model])
+    @api.response(409, 'an operation could not be applied, nothing was changed', [item_operation_result_model])
+    @api.response(400, 'invalid operations')
+    @api.expect([item_operation_model])
+    def patch(self, shopcart_id):
+        """
+        Apply a list of add/update/delete/hold operations to shopcart {shopcart_id}.
+        The operations are applied in order in one transaction, either all of
+        them or none, and the result of each one is returned
+        """
+        check_content_type("application/json")
+        operations = parse_operations(shopcart_id, request.get_json())
+        applied, results = Shopcart.apply_operations(shopcart_id, operations)
+        app.logger.info("Applied %d operations to shopcart %s: %s", len(operations), shopcart_id, applied)
+        body = [
+            {'op': op, 'item_id': item_id, 'status_code': code,
+             'item': serialize_item(item) if item is not None else None}
+            for (op, item_id, _), (code, item) in zip(operations, results)
+        ]
+        return body, status.HTTP_200_OK if applied else status.HTTP_409_CONFLICT
             
 
 ######################################################################
@@ -353,8 +538,7 @@ class ItemResource(Resource):
     ######################################################################
     @api.doc('get_items')
     @api.response(404, 'not found')
-    @api.response(200, 'item retrieved')
-    @api.marshal_with(item_model)
+    @api.response(200, 'item retrieved', item_model)
 
     def get(self, shopcart_id, item_id):
         """
@@ -364,28 +548,27 @@ class ItemResource(Resource):
 
         app.logger.info("Request for an item with id: %s in shopcart with id: %s", item_id, shopcart_id)
 
-        shopcart = Shopcart.find_shopcart(shopcart_id) 
-        if not shopcart:
+        found, item = Shopcart.find_item_in_shopcart(shopcart_id, item_id)
+        if not found:
             abort(status.HTTP_404_NOT_FOUND,
                 "Shopcart with id '{}' was not found.".format(shopcart_id)
                 )
-        item = Shopcart.find_item(shopcart_id, item_id)
         if not item:
             abort(status.HTTP_404_NOT_FOUND,
                 "Item with the id '{}' in shopcart'{}' was not found".format(item_id,shopcart_id) 
             )
-        return item.serialize(), status.HTTP_200_OK
+        return serialize_item(item), status.HTTP_200_OK
 
 
     ######################################################################
     # UPDATE AN ITEM
     ######################################################################
-    @api.doc('update_items')
+    @api.doc('update_items', params={'If-Match': {'in': 'header', 'description': 'Optional, the ETag the Shopcart must still have'}})
+    @api.response(412, 'shopcart changed since the ETag in If-Match')
     @api.response(404, 'not found')
     @api.response(400, 'invalid quantity or price')
-    @api.response(200, 'item updated')
+    @api.response(200, 'item updated', item_model)
     @api.expect(update_item_model)
-    @api.marshal_with(item_model)
 
     def put(self, shopcart_id, item_id):
         """
@@ -394,47 +577,30 @@ class ItemResource(Resource):
         """
         app.logger.info("Request to update an item")
         check_content_type("application/json")
+        expected = expected_version()
 
-        req = request.get_json()
-        if not "quantity" in req.keys() and not "price" in req.keys():
-            abort(status.HTTP_400_BAD_REQUEST, "Must have either quantity or price.")
-        quantity = None
-        price = None
-        if "quantity" in req.keys():
-            if not isinstance(req["quantity"], int) or req["quantity"] <= 0:
-                abort(status.HTTP_400_BAD_REQUEST, "Invalid quantity.")
-            else:
-                quantity = req["quantity"]
-        if "price" in req.keys():
-            if (not isinstance(req["price"], int) and not isinstance(req["price"], float)) or req["price"] < 0:
-                abort(status.HTTP_400_BAD_REQUEST, "Invalid price.")
-            else:
-                price = req["price"]
-        
-        # Make sure the shopcart exists
-        shopcart = Shopcart.find_shopcart(shopcart_id)
-        if not shopcart:
+        changes = check_item(validate_update, request.get_json())
+
+        # Make sure the shopcart and the item exist, loaded from the database as it is changed
+        found, item = Shopcart.find_item_in_shopcart(shopcart_id, item_id, cached=False)
+        if not found:
             abort(status.HTTP_404_NOT_FOUND, f"Shopcart with id {shopcart_id} was not found.")
-        # Make sure the item exists
-        item = Shopcart.find_item(shopcart_id, item_id)
         if not item:
             abort(status.HTTP_404_NOT_FOUND, f"item with id {item_id} was not found.")
         
         # Now proceed to update
-        if quantity:
-            item.quantity = quantity
-            app.logger.info(f"item {item_id}'s quantity is changed to {quantity}")
-        if price != None and price >= 0:
-            item.price = price
-            app.logger.info(f"item {item_id}'s price is changed to {price}")
-        item.create()
-        return item.serialize(), status.HTTP_200_OK
+        for name, value in changes.items():
+            setattr(item, name, value)
+            app.logger.info("item %s's %s is changed to %s", item_id, name, value)
+        version = item.save(expected)
+        return serialize_item(item), status.HTTP_200_OK, {'ETag': quote_etag(str(version))}
 
 
     ######################################################################
     # DELETE AN ITEM
     ######################################################################
-    @api.doc('delete_items')
+    @api.doc('delete_items', params={'If-Match': {'in': 'header', 'description': 'Optional, the ETag the Shopcart must still have'}})
+    @api.response(412, 'shopcart changed since the ETag in If-Match')
     @api.response(204, 'deleted')
 
     def delete(self, shopcart_id, item_id):
@@ -444,13 +610,18 @@ class ItemResource(Resource):
         """
 
         app.logger.info("Attempting to delete item %s from shopcart %s...", item_id, shopcart_id)
-        try:
-            item = Shopcart.find_item_or_404(shopcart_id, item_id)
-            item.delete()
-        except NotFound:
-            pass
+        expected = expected_version()
+        item = Shopcart.find_item(shopcart_id, item_id, cached=False)
+        if item:
+            version = item.delete(expected)
+        else:
+            version = Shopcart.get_version(shopcart_id)
+            if expected is not None and expected != version:
+                raise VersionMismatchError(
+                    f"Shopcart with user_id '{shopcart_id}' is no longer at version {expected}."
+                )
         app.logger.info("Making 204 response...")
-        return "", status.HTTP_204_NO_CONTENT
+        return "", status.HTTP_204_NO_CONTENT, {'ETag': quote_etag(str(version))}
 
 
 ######################################################################
@@ -472,24 +643,23 @@ class HoldResource(Resource):
 	######################################################################
     @api.doc("hold_items")
     @api.response(404, 'Shopcart or Item not found')
-    @api.response(200, 'Item put on hold')
-    @api.marshal_list_with(item_model)
+    @api.response(200, 'Item put on hold', item_model)
     def put(self, user_id, item_id):
         """
         Hold an item in shopcart {shopcart_id} with item_id {item_id}
         (won't be ordered when user checks out the shopcart)
         """   
-        shopcart = Shopcart.find_shopcart(user_id)
-        if not shopcart:
+        # Make sure the shopcart and the item exist, loaded from the database as it is changed
+        found, item = Shopcart.find_item_in_shopcart(user_id, item_id, cached=False)
+        if not found:
             abort(status.HTTP_404_NOT_FOUND, f"Shopcart with id {user_id} was not found.")
-        # Make sure the item exists
-        item = Shopcart.find_item(user_id, item_id)
         if not item:
             abort(status.HTTP_404_NOT_FOUND, f"item with id {item_id} was not found.")
         item.hold = True
+        item.save()
         app.logger.info("Attempting to hold item %s from shopcart %s...", item_id, user_id)
         app.logger.info("Making 200 response...")
-        return make_response(jsonify(item.serialize()), status.HTTP_200_OK)
+        return serialize_item(item), status.HTTP_200_OK
         
 ######################################################################
 #  PATH: /shopcarts/{id}/items/{item_id}/resume
@@ -510,34 +680,184 @@ class ResumeResource(Resource):
 	######################################################################
     @api.doc("resume_items")
     @api.response(404, 'Shopcart or Item not found')
-    @api.response(200, 'Item resumed')
-    @api.marshal_list_with(item_model)
+    @api.response(200, 'Item resumed', item_model)
     def put(self, user_id, item_id):
         """
         Resume item in shopcart {shopcart_id} with item_id {item_id}
             from held (will be ordered when user checks out the shopcart)
         """   
         app.logger.info("Attempting to resume item %s from shopcart %s...", item_id, user_id)
-        shopcart = Shopcart.find_shopcart(user_id)
-        if not shopcart:
+        # Make sure the shopcart and the item exist, loaded from the database as it is changed
+        found, item = Shopcart.find_item_in_shopcart(user_id, item_id, cached=False)
+        if not found:
             abort(status.HTTP_404_NOT_FOUND, f"Shopcart with id {user_id} was not found.")
-        # Make sure the item exists
-        item = Shopcart.find_item(user_id, item_id)
         if not item:
             abort(status.HTTP_404_NOT_FOUND, f"item with id {item_id} was not found.")
         item.hold = False
+        item.save()
         app.logger.info("Making 200 response...")
-        return make_response(jsonify(item.serialize()), status.HTTP_200_OK)
+        return serialize_item(item), status.HTTP_200_OK
+
+######################################################################
+#  PATH: /shopcarts/{id}/hold
+######################################################################
+@api.route('/shopcarts/<int:user_id>/hold', strict_slashes=False)
+@api.param('user_id', 'The User identifier')
+class ShopcartHoldResource(Resource):
+    """
+    ShopcartHoldResource class
+
+    Allows the holding status changes of many Items at once
+    PUT /shopcarts/{id}/hold - Updates the holding status of the Items to True
+    """
+
+    ######################################################################
+    # HOLD ITEMS
+    ######################################################################
+    @api.doc("hold_shopcart_items")
+    @api.response(404, 'Shopcart or Items not found')
+    @api.response(400, 'invalid item ids')
+    @api.response(200, 'Items put on hold', [item_model])
+    @api.expect(item_ids_model)
+    def put(self, user_id):
+        """
+        Hold the items {item_ids} (or all items) in shopcart {user_id}
+        """
+        app.logger.info("Attempting to hold items in shopcart %s...", user_id)
+        items = Shopcart.set_hold(user_id, True, get_item_ids())
+        if not items:
+            abort(status.HTTP_404_NOT_FOUND, f"No items to hold in shopcart with id {user_id}.")
+        return [serialize_item(item) for item in items], status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /shopcarts/{id}/resume
+######################################################################
+@api.route('/shopcarts/<int:user_id>/resume', strict_slashes=False)
+@api.param('user_id', 'The User identifier')
+class ShopcartResumeResource(Resource):
+    """
+    ShopcartResumeResource class
+
+    Allows the holding status changes of many Items at once
+    PUT /shopcarts/{id}/resume - Updates the holding status of the Items to False
+    """
+
+    ######################################################################
+    # RESUME ITEMS
+    ######################################################################
+    @api.doc("resume_shopcart_items")
+    @api.response(404, 'Shopcart or Items not found')
+    @api.response(400, 'invalid item ids')
+    @api.response(200, 'Items resumed', [item_model])
+    @api.expect(item_ids_model)
+    def put(self, user_id):
+        """
+        Resume the items {item_ids} (or all items) in shopcart {user_id}
+        """
+        app.logger.info("Attempting to resume items in shopcart %s...", user_id)
+        items = Shopcart.set_hold(user_id, False, get_item_ids())
+        if not items:
+            abort(status.HTTP_404_NOT_FOUND, f"No items to resume in shopcart with id {user_id}.")
+        return [serialize_item(item) for item in items], status.HTTP_200_OK
 
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
 
 def init_db():
-    """ Initializes the SQLAlchemy app """
+    """ Initializes the SQLAlchemy app, the tables are made by the migrations """
     global app
     Shopcart.init_db(app)
 
+def get_item_ids():
+    """ Returns the item_ids of an optional JSON body, None when there is no body """
+    if not request.get_data():
+        return None
+    check_content_type("application/json")
+    req = request.get_json()
+    item_ids = req.get("item_ids") if isinstance(req, dict) else None
+    if item_ids is None:
+        return None
+    if not isinstance(item_ids, list) or not all(
+            isinstance(item_id, int) and not isinstance(item_id, bool) and item_id >= 0
+            for item_id in item_ids):
+        abort(status.HTTP_400_BAD_REQUEST, "item_ids must be a list of non-negative integers.")
+    return item_ids
+
+def parse_operations(user_id, operations):
+    """
+    Validates the operations of PATCH /shopcarts/{id}/items before any is applied
+
+    Returns:
+        list: (op, item_id, value) tuples for Shopcart.apply_operations
+    """
+    if not isinstance(operations, list) or not operations:
+        abort(status.HTTP_400_BAD_REQUEST, "The body must be a non-empty list of operations.")
+    if len(operations) > app.config["SHOPCART_OPERATIONS_MAX"]:
+        abort(status.HTTP_400_BAD_REQUEST,
+              f"At most {app.config['SHOPCART_OPERATIONS_MAX']} operations are accepted at once.")
+    valid, errors = validate_operation.validate_many(operations)
+    if errors:
+        raise_validation_error("operations", errors)
+    parsed = []
+    for index, operation in enumerate(valid):
+        op, item_id, value = operation["op"], operation["item_id"], None
+        if op in ("add", "update"):
+            # the types are checked already, this adds the fields each op requires
+            validator = validate_item if op == "add" else validate_update
+            value, errors = validator.validate(operation, index)
+            if errors:
+                raise_validation_error("operations", errors)
+            if op == "add":
+                value = Shopcart(user_id=user_id, **value)
+        elif op == "hold":
+            value = operation.get("hold", True)
+        parsed.append((op, item_id, value))
+    return parsed
+
+def check_items(validator, items):
+    """
+    Validates a list of items from a request body in one pass
+
+    Returns:
+        list: the valid fields of every item
+
+    Raises:
+        DataValidationError: with the errors of every field of every item
+    """
+    if not isinstance(items, list):
+        raise DataValidationError(f"Invalid {validator.name}: the items must be a list")
+    valid, errors = validator.validate_many(items)
+    if errors:
+        raise_validation_error(validator.name, errors)
+    return valid
+
+def check_item(validator, item):
+    """ Validates one item from a request body, returns its valid fields """
+    valid, errors = validator.validate(item)
+    if errors:
+        raise_validation_error(validator.name, errors)
+    return valid
+
+def raise_validation_error(name, errors):
+    """ Raises a DataValidationError holding the structured errors """
+    raise DataValidationError(f"Invalid {name}: {describe_errors(errors)}", errors)
+
+def expected_version():
+    """
+    Returns the Shopcart version required by the If-Match header, None without one
+
+    ETags are compared strongly, so a weak or unknown ETag never matches
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    for etag in if_match:
+        if etag.isdigit():
+            return int(etag)
+    raise VersionMismatchError("If-Match does not hold a version of the Shopcart.")
+
 def check_content_type(media_type):
     """Checks that the media type is correct"""
     content_type = request.headers.get("Content-Type")
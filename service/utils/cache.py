@@ -0,0 +1,105 @@
+"""
+Cache
+
+This module contains a small thread-safe LRU cache with a time to live,
+meant to sit in front of database lookups inside one worker process
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Least recently used cache with a size limit and a time to live
+
+    A maxsize of 0 disables the cache: every get() is a miss and set()
+    stores nothing. Values are never None, so None means "not cached".
+    """
+
+    def __init__(self, maxsize=0, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation, see token() and set()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        """ True when the cache can hold entries """
+        return self.maxsize > 0
+
+    def get(self, key):
+        """ Returns the cached value for key, or None on a miss """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def token(self):
+        """
+        Returns a token to take before reading the value to be cached
+
+        Passing it to set() makes sure a value read before a concurrent
+        invalidation is not stored after it.
+        """
+        return self._generation
+
+    def set(self, key, value, token=None):
+        """ Stores value under key, evicting the least recently used entry """
+        if not self.enabled:
+            return
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """ Removes the entries for the given keys """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        """ Removes every entry """
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """ Returns the counters of the cache as a dictionary """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,94 @@
+"""
+Database Pool
+
+This module contains a SQLAlchemy connection pool that records how long
+checkouts wait, and a function to report the live state of a pool
+"""
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """ Counters for connection checkouts in this process """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Sets all of the counters back to zero """
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        """ Records one checkout and how long it waited """
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self):
+        """ Returns the counters as a dictionary """
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_seconds": round(self.wait_total, 6),
+                "wait_avg_seconds": round(self.wait_total / attempts, 6) if attempts else 0.0,
+                "wait_max_seconds": round(self.wait_max, 6),
+            }
+
+
+# One engine per process, so the counters are shared by every pool it makes
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that times every checkout
+
+    The time includes waiting for a free connection, opening a new one
+    when the pool has room, and the pre-ping when it is enabled.
+    """
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kw):
+        self.max_overflow = max_overflow
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def pool_status(pool):
+    """ Returns the live state of a connection pool as a dictionary """
+    if not isinstance(pool, QueuePool):
+        return {"status": pool.status()}
+    status = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # QueuePool counts overflow from -size, so it is negative until full
+        "open": pool.size() + pool.overflow(),
+        "overflow": max(pool.overflow(), 0),
+        "timeout": pool.timeout(),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        status["max_overflow"] = pool.max_overflow
+        status.update(pool_stats.snapshot())
+    return status
@@ -0,0 +1,36 @@
+"""
+JSON encoding
+
+This module holds the JSON encoders responses can be written with: orjson
+when it is installed, and the standard library one which is always there
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def stdlib_dumps(data):
+    """ Encodes data into JSON bytes with the standard library """
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+ENCODERS = {"json": stdlib_dumps}
+if orjson is not None:
+    ENCODERS["orjson"] = orjson.dumps
+
+
+def get_encoder(name="auto"):
+    """
+    Returns the function encoding data into JSON bytes
+
+    Args:
+        name (str): "orjson", "json", or "auto" for the fastest one installed
+    """
+    if name == "auto":
+        name = "orjson" if "orjson" in ENCODERS else "json"
+    if name not in ENCODERS:
+        raise ValueError(f"JSON encoder '{name}' is not available, use one of {sorted(ENCODERS)}")
+    return ENCODERS[name]
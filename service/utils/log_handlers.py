@@ -18,19 +18,122 @@
 Log Handlers
 
 This module contains utility functions to set up logging
-consistently
+consistently. Records can be handed to a background thread through a
+queue, so requests don't wait for formatting and writes, sampled below
+WARNING, and written as JSON lines.
 """
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+# the attributes every LogRecord has, the others came from extra=
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats a record as one JSON object, with the fields given in extra= """
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES:
+                data[name] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """ Keeps a random share of the records below WARNING, and all of the others """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never waits for the listener
+
+    Records are queued as they are, the listener thread formats them. When
+    the queue is full the record is dropped and counted instead.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_queue_logging(logger, handlers, maxsize):
+    """
+    Moves the handlers of a logger behind a queue and a background thread
+
+    Returns:
+        NonBlockingQueueHandler: the handler now attached to the logger
+    """
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize))
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    def stop():
+        # writes the queued records before the process exits
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+
+    def restart_after_fork():
+        # the thread did not survive the fork, and the queue may hold the parent's records
+        queue_handler.queue = listener.queue = queue.Queue(maxsize)
+        listener.start()
+
+    atexit.register(stop)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=restart_after_fork)
+    logger.handlers = [queue_handler]
+    return queue_handler
 
 
 def init_logging(app, logger_name: str):
     """Set up logging for production"""
     app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = list(gunicorn_logger.handlers)
+    app.logger.handlers = handlers
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
+    if app.config.get("LOG_FORMAT", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+    for handler in handlers:
         handler.setFormatter(formatter)
+    sample_rate = app.config.get("LOG_SAMPLE_RATE", 1.0)
+    if sample_rate < 1.0:
+        app.logger.addFilter(SamplingFilter(sample_rate))
+    if app.config.get("LOG_QUEUE", False) and handlers:
+        start_queue_logging(app.logger, handlers, app.config.get("LOG_QUEUE_SIZE", 10000))
     app.logger.info("Logging handler established")
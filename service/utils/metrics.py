@@ -0,0 +1,120 @@
+"""
+Metrics
+
+This module exports Prometheus metrics of the requests: their latency by
+flask-restx resource, method and status, and the SQL statements each one
+runs. Under gunicorn every worker writes its samples to the directory in
+PROMETHEUS_MULTIPROC_DIR and /metrics adds up the samples of all of them.
+
+prometheus_client is optional, without it nothing is recorded.
+"""
+import os
+import time
+from flask import request
+
+from . import query_stats
+from .db_pool import pool_status
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram,
+                                   generate_latest, multiprocess)
+except ImportError:  # pragma: no cover
+    Histogram = None
+
+# seconds between two updates of the pool and cache gauges of a worker
+GAUGE_INTERVAL = 1.0
+
+if Histogram is not None:
+    REQUEST_LATENCY = Histogram(
+        "shopcart_request_duration_seconds", "Latency of the requests, its _count counts them",
+        ["resource", "method", "status"],
+    )
+    REQUEST_QUERIES = Histogram(
+        "shopcart_request_db_queries", "SQL statements run by one request",
+        ["resource", "method"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+    )
+    REQUEST_QUERY_TIME = Histogram(
+        "shopcart_request_db_seconds", "Time one request spent running SQL statements",
+        ["resource", "method"],
+    )
+    # gauges of dead workers are dropped, the live ones are added up
+    POOL_GAUGE = Gauge("shopcart_db_pool", "Database connection pool of the workers",
+                       ["state"], multiprocess_mode="livesum")
+    CACHE_GAUGE = Gauge("shopcart_cache", "Shopcart cache of the workers",
+                        ["state"], multiprocess_mode="livesum")
+
+
+def enabled():
+    """ True when prometheus_client is installed """
+    return Histogram is not None
+
+
+def resource_name(app, endpoint):
+    """
+    Returns the label of an endpoint: the class of a flask-restx resource
+    like "ShopcartCollection", or the endpoint of a plain Flask view
+    """
+    if endpoint is None:
+        return "unmatched"
+    view = app.view_functions.get(endpoint)
+    view_class = getattr(view, "view_class", None)
+    return view_class.__name__ if view_class is not None else endpoint
+
+
+def init_metrics(app, cache_getter, engine_getter):
+    """
+    Records the metrics of every request of the app, which must count
+    its statements with query_stats.init_app() first
+
+    Args:
+        app (Flask): the application
+        cache_getter (callable): returns the LRUCache whose stats are exported
+        engine_getter (callable): returns the engine whose pool is exported
+    """
+    if not enabled():
+        app.logger.warning("prometheus_client is not installed, /metrics is disabled")
+        return
+    # resolving the label of an endpoint walks the view functions, do it once
+    labels = {}
+    state = {"gauges_at": 0.0}
+
+    @app.after_request
+    def record_request(response):
+        # the request is timed from the start of its statement counters
+        stats = query_stats.current()
+        if stats is None:
+            return response
+        seconds = time.perf_counter() - stats.started
+        resource = labels.get(request.endpoint)
+        if resource is None:
+            resource = labels[request.endpoint] = resource_name(app, request.endpoint)
+        method = request.method.lower()
+        REQUEST_LATENCY.labels(resource, method, str(response.status_code)).observe(seconds)
+        REQUEST_QUERIES.labels(resource, method).observe(stats.count)
+        REQUEST_QUERY_TIME.labels(resource, method).observe(stats.seconds)
+        now = time.monotonic()
+        if now - state["gauges_at"] >= GAUGE_INTERVAL:
+            state["gauges_at"] = now
+            update_gauges(cache_getter(), engine_getter())
+        return response
+
+
+def update_gauges(cache, engine):
+    """ Sets the pool and cache gauges from the state of this worker """
+    pool = pool_status(engine.pool)
+    for name in ("size", "checked_out", "checked_in", "overflow", "timeouts"):
+        if name in pool:
+            POOL_GAUGE.labels(name).set(pool[name])
+    if cache is not None:
+        for name, value in cache.stats().items():
+            if name in ("size", "hits", "misses", "evictions", "expirations"):
+                CACHE_GAUGE.labels(name).set(value)
+
+
+def render():
+    """ Returns the body and content type of a scrape of the metrics """
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,131 @@
+"""
+Query Stats
+
+This module counts the SQL statements each request runs and how long they
+take, from SQLAlchemy cursor events on every engine. The totals are sent
+back in a Server-Timing header and logged, and requests going over the
+SQL_BUDGET_QUERIES or SQL_BUDGET_MS budget are logged with the
+fingerprints of their statements, which makes N+1 queries stand out.
+"""
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# literals and bound parameters, replaced by ? in fingerprints
+LITERALS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b")
+LISTS = re.compile(r"\(\?(?:\s*,\s*\?)+\)")
+SPACES = re.compile(r"\s+")
+
+
+class QueryStats:
+    """ The statements run by one request """
+
+    __slots__ = ("count", "seconds", "started", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.started = time.perf_counter()
+        # (statement, seconds) of every statement, fingerprinted only when logged
+        self.statements = []
+
+    def fingerprints(self):
+        """ Returns (fingerprint, count, seconds) of the statements, the most run first """
+        counts, seconds = Counter(), Counter()
+        for statement, duration in self.statements:
+            key = fingerprint(statement)
+            counts[key] += 1
+            seconds[key] += duration
+        return [(key, count, seconds[key]) for key, count in counts.most_common()]
+
+
+def fingerprint(statement):
+    """ Returns a statement without its literals, so runs of the same query look the same """
+    statement = LITERALS.sub("?", statement)
+    return SPACES.sub(" ", LISTS.sub("(...)", statement)).strip()
+
+
+def start_request():
+    """ Starts counting the statements of the current request """
+    g.query_stats = QueryStats()
+
+
+def current():
+    """ Returns the QueryStats of the current request, None outside of one """
+    if not has_request_context():
+        return None
+    return g.get("query_stats")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+        stats.statements.append((statement, seconds))
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def init_query_stats():
+    """ Listens to the statements of every engine, once per process """
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+def server_timing(stats):
+    """ Returns the Server-Timing header of a request """
+    total = (time.perf_counter() - stats.started) * 1000
+    return f'db;desc="{stats.count} queries";dur={stats.seconds * 1000:.1f}, app;dur={total:.1f}'
+
+
+def init_app(app):
+    """ Counts the statements of every request of the app """
+    init_query_stats()
+
+    @app.before_request
+    def start_query_stats():
+        start_request()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = current()
+        if stats is None:
+            return response
+        if app.config.get("SQL_TIMING_HEADER", True):
+            response.headers.add("Server-Timing", server_timing(stats))
+        db_ms = round(stats.seconds * 1000, 3)
+        fields = {"db_queries": stats.count, "db_ms": db_ms}
+        max_queries = app.config.get("SQL_BUDGET_QUERIES", 0)
+        max_ms = app.config.get("SQL_BUDGET_MS", 0)
+        if (max_queries and stats.count > max_queries) or (max_ms and db_ms > max_ms):
+            fields["db_fingerprints"] = [
+                {"sql": key, "count": count, "ms": round(seconds * 1000, 3)}
+                for key, count, seconds in stats.fingerprints()
+            ]
+            app.logger.warning(
+                "SQL budget exceeded by %s %s: %d queries in %.1f ms, %s",
+                request.method, request.path, stats.count, db_ms,
+                "; ".join(f"{item['count']}x {item['sql']}" for item in fields["db_fingerprints"]),
+                extra=fields,
+            )
+        elif app.config.get("SQL_LOG_REQUESTS", False):
+            app.logger.info("%s %s: %d queries in %.1f ms", request.method, request.path,
+                            stats.count, db_ms, extra=fields)
+        return response
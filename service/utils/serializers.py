@@ -0,0 +1,42 @@
+"""
+Serializers
+
+This module compiles a flask-restx model into a function that turns an
+object into the dict the model documents, so responses can skip the field
+by field walk of marshal() and still match the Swagger docs
+"""
+from operator import attrgetter
+from flask_restx import fields
+
+
+def compile_serializer(model):
+    """
+    Returns a function serializing an object (or a row) into a dict shaped like model
+
+    The model must be flat. Float fields are converted to float like marshal()
+    does, the other values are taken as they are since the database already
+    returns them with the documented types.
+
+    Args:
+        model (Model): the flask-restx model documenting the response
+    """
+    # a model may hold field classes as well as instances, like marshal() allows
+    model_fields = {name: field() if isinstance(field, type) else field for name, field in model.items()}
+    names = tuple(model_fields)
+    for name, field in model_fields.items():
+        if isinstance(field, (fields.Nested, fields.List)):
+            raise ValueError(f"Field '{name}' of model '{model.name}' is not flat")
+    floats = tuple(name for name, field in model_fields.items() if isinstance(field, fields.Float))
+    getter = attrgetter(*(model_fields[name].attribute or name for name in names))
+    if len(names) == 1:
+        # attrgetter returns the value itself rather than a tuple of one
+        getter = (lambda get: lambda obj: (get(obj),))(getter)
+
+    def serialize(obj):
+        data = dict(zip(names, getter(obj)))
+        for name in floats:
+            if data[name] is not None:
+                data[name] = float(data[name])
+        return data
+
+    return serialize
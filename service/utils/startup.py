@@ -0,0 +1,50 @@
+"""
+Startup
+
+This module times the steps of starting the service, so the cold start of
+a new instance can be watched when scaling out
+"""
+import os
+import time
+
+
+class StartupTimer:
+    """
+    Records how long each startup step took
+
+    Steps are marked in order, each one lasting from the previous mark.
+    A worker forked from a preloaded app inherits the steps of its parent
+    and marks its own fork with forked().
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pid = os.getpid()
+        self.steps = []
+        self._last = self.started
+
+    def mark(self, step):
+        """ Records the end of a step and returns how long it took """
+        now = time.perf_counter()
+        seconds = now - self._last
+        self.steps.append((step, seconds))
+        self._last = now
+        return seconds
+
+    def forked(self):
+        """ Starts timing a worker process forked from this one """
+        self.pid = os.getpid()
+        self._last = time.perf_counter()
+
+    @property
+    def total(self):
+        """ The seconds from the start to the last mark """
+        return self._last - self.started
+
+    def snapshot(self):
+        """ Returns the steps as a dictionary """
+        return {
+            "pid": self.pid,
+            "steps": {step: round(seconds, 6) for step, seconds in self.steps},
+            "total_seconds": round(sum(seconds for _, seconds in self.steps), 6),
+        }
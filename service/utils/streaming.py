@@ -0,0 +1,29 @@
+"""
+Streaming
+
+This module writes large JSON arrays to the client a chunk at a time,
+so a listing never has to be held in memory as a whole
+"""
+import json
+from itertools import islice
+
+
+def stream_json_array(rows, chunk_size=1000):
+    """
+    Yields the JSON array of rows as text, chunk_size rows at a time
+
+    Args:
+        rows (iterable): JSON serializable rows, consumed lazily
+        chunk_size (int): how many rows are encoded per chunk
+    """
+    rows = iter(rows)
+    yield "["
+    separator = ""
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        # encode the whole chunk in one call and drop its brackets
+        yield separator + json.dumps(chunk)[1:-1]
+        separator = ", "
+    yield "]\n"
@@ -0,0 +1,156 @@
+"""
+Validation
+
+This module compiles a flask-restx model into a validator for request bodies,
+so every write endpoint checks items against the same rules the Swagger docs
+show. The checks are built once and a whole batch of items is checked in one
+pass, collecting per-field errors instead of raising on the first one
+"""
+from flask_restx import fields
+
+# the JSON types accepted by each field type, bool is an int in Python and is rejected
+FIELD_TYPES = (
+    (fields.Boolean, (bool,), "a boolean"),
+    (fields.Integer, (int,), "an integer"),
+    (fields.Float, (int, float), "a number"),
+    (fields.String, (str,), "a string"),
+)
+
+
+def _limit(field, bound):
+    """ Returns the check of the min or max keywords of a field, None without them """
+    above = bound == "minimum"
+    limit = getattr(field, bound, None)
+    exclusive = getattr(field, "exclusiveMinimum" if above else "exclusiveMaximum", None)
+    if exclusive is not None and not isinstance(exclusive, bool):
+        # a number, like newer JSON schema drafts write it
+        limit, exclusive = exclusive, True
+    if limit is None:
+        return None
+    if above and exclusive:
+        return (lambda value: value > limit, f"must be greater than {limit}")
+    if above:
+        return (lambda value: value >= limit, f"must be at least {limit}")
+    if exclusive:
+        return (lambda value: value < limit, f"must be less than {limit}")
+    return (lambda value: value <= limit, f"must be at most {limit}")
+
+
+def _checks(field):
+    """ Returns the (accept, message) checks of the keywords of a field """
+    checks = [check for check in (_limit(field, "minimum"), _limit(field, "maximum")) if check]
+    enum = getattr(field, "enum", None)
+    if enum:
+        checks.append((lambda value: value in enum, f"must be one of {', '.join(map(str, enum))}"))
+    return checks
+
+
+def _compile_field(name, field):
+    """ Returns a function giving the error message of a value, None when it is valid """
+    for field_type, types, description in FIELD_TYPES:
+        if isinstance(field, field_type):
+            break
+    else:
+        raise ValueError(f"Field '{name}' of type {type(field).__name__} cannot be validated")
+    type_message = f"must be {description}"
+    reject_bool = bool not in types
+    checks = _checks(field)
+
+    def check(value):
+        if not isinstance(value, types) or (reject_bool and isinstance(value, bool)):
+            return type_message
+        for accept, message in checks:
+            if not accept(value):
+                return message
+        return None
+
+    return check
+
+
+class Validator:
+    """
+    Validates dicts against a flat flask-restx model
+
+    Fields of the model that are missing and not required take their default
+    when it is set, keys that are not in the model are dropped. With
+    require_any at least one field of the model must be given.
+    """
+
+    def __init__(self, model, require_any=False):
+        # a model may hold field classes as well as instances, like marshal() allows
+        model_fields = {name: field() if isinstance(field, type) else field for name, field in model.items()}
+        self.name = model.name
+        self.rules = tuple(
+            (name, bool(field.required), field.default, _compile_field(name, field))
+            for name, field in model_fields.items() if not field.readonly
+        )
+        self.require_any = require_any
+
+    def validate(self, data, index=None):
+        """
+        Validates one dict
+
+        Args:
+            data (dict): the decoded JSON object
+            index (int): the position of data in its batch, added to the errors
+
+        Returns:
+            tuple: (the valid fields, a list of error dicts), the fields are None on errors
+        """
+        if not isinstance(data, dict):
+            return None, [self._error(index, None, f"must be a {self.name} object")]
+        valid, errors = {}, []
+        for name, required, default, check in self.rules:
+            if name not in data:
+                if required:
+                    errors.append(self._error(index, name, "is required"))
+                elif default is not None:
+                    valid[name] = default
+                continue
+            message = check(data[name])
+            if message is None:
+                valid[name] = data[name]
+            else:
+                errors.append(self._error(index, name, message))
+        if self.require_any and not valid and not errors:
+            names = " or ".join(rule[0] for rule in self.rules)
+            errors.append(self._error(index, None, f"must have {names}"))
+        return (None if errors else valid), errors
+
+    def validate_many(self, items):
+        """
+        Validates a batch of dicts in one pass
+
+        Returns:
+            tuple: (the valid fields of every item, a list of error dicts of all items)
+        """
+        valid, errors = [], []
+        for index, data in enumerate(items):
+            item_fields, item_errors = self.validate(data, index)
+            if item_errors:
+                errors.extend(item_errors)
+            else:
+                valid.append(item_fields)
+        return valid, errors
+
+    @staticmethod
+    def _error(index, field, message):
+        error = {"field": field, "message": message}
+        if index is not None:
+            error["index"] = index
+        return error
+
+
+def compile_validator(model, require_any=False):
+    """ Returns a Validator for the fields of a flat flask-restx model """
+    return Validator(model, require_any)
+
+
+def describe_errors(errors):
+    """ Returns one readable message for a list of error dicts """
+    return "; ".join(
+        ("" if "index" not in error else f"item {error['index']}: ")
+        + (f"{error['field']} " if error["field"] else "")
+        + error["message"]
+        for error in errors
+    )
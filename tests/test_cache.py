@@ -0,0 +1,78 @@
+"""
+Test cases for the LRU cache utility
+
+"""
+import unittest
+from unittest.mock import patch
+
+from service.utils.cache import LRUCache
+
+######################################################################
+#  L R U   C A C H E   T E S T   C A S E S
+######################################################################
+class TestLRUCache(unittest.TestCase):
+    """ Test Cases for LRUCache """
+
+    def test_disabled(self):
+        """ A cache with no size never stores anything """
+        cache = LRUCache(0)
+        cache.set(1, "cart")
+        self.assertIsNone(cache.get(1))
+        self.assertFalse(cache.stats()["enabled"])
+        self.assertEqual(cache.stats()["misses"], 0)
+
+    def test_hit_and_miss(self):
+        """ Count hits and misses """
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, "cart")
+        self.assertEqual(cache.get(1), "cart")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_eviction(self):
+        """ Evict the least recently used entry when full """
+        cache = LRUCache(2)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.get(1)
+        cache.set(3, "three")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expiration(self):
+        """ Expire entries older than the time to live """
+        cache = LRUCache(2, ttl=10)
+        with patch("service.utils.cache.time.monotonic", return_value=100.0):
+            cache.set(1, "cart")
+        with patch("service.utils.cache.time.monotonic", return_value=105.0):
+            self.assertEqual(cache.get(1), "cart")
+        with patch("service.utils.cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalidate(self):
+        """ Invalidate some of the entries """
+        cache = LRUCache(3)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.invalidate(1, 3)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(2), "two")
+        cache.clear()
+        self.assertIsNone(cache.get(2))
+
+    def test_stale_set_after_invalidate(self):
+        """ Do not store a value that was read before an invalidation """
+        cache = LRUCache(2)
+        token = cache.token()
+        cache.invalidate(1)
+        cache.set(1, "stale", token)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, "fresh", cache.token())
+        self.assertEqual(cache.get(1), "fresh")
@@ -0,0 +1,66 @@
+"""
+Test cases for the instrumented connection pool
+
+"""
+import sqlite3
+import unittest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from service.utils.db_pool import InstrumentedQueuePool, pool_stats, pool_status
+
+######################################################################
+#  D B   P O O L   T E S T   C A S E S
+######################################################################
+class TestInstrumentedQueuePool(unittest.TestCase):
+    """ Test Cases for InstrumentedQueuePool """
+
+    def setUp(self):
+        """ This runs before each test """
+        pool_stats.reset()
+        self.pool = InstrumentedQueuePool(
+            lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=1, timeout=0.05
+        )
+
+    def tearDown(self):
+        """ This runs after each test """
+        self.pool.dispose()
+        pool_stats.reset()
+
+    def test_checkouts(self):
+        """ Count checkouts and report the pool state """
+        first = self.pool.connect()
+        second = self.pool.connect()
+        status = pool_status(self.pool)
+        self.assertEqual(status["size"], 1)
+        self.assertEqual(status["max_overflow"], 1)
+        self.assertEqual(status["checked_out"], 2)
+        self.assertEqual(status["overflow"], 1)
+        self.assertEqual(status["open"], 2)
+        self.assertEqual(status["checkouts"], 2)
+        self.assertEqual(status["timeouts"], 0)
+        first.close()
+        second.close()
+        self.assertEqual(pool_status(self.pool)["checked_out"], 0)
+
+    def test_timeout(self):
+        """ Count checkouts that time out waiting for a connection """
+        connections = [self.pool.connect(), self.pool.connect()]
+        self.assertRaises(PoolTimeoutError, self.pool.connect)
+        status = pool_status(self.pool)
+        self.assertEqual(status["timeouts"], 1)
+        self.assertGreaterEqual(status["wait_max_seconds"], 0.05)
+        for connection in connections:
+            connection.close()
+
+    def test_recreate(self):
+        """ Keep the settings when the pool is recreated """
+        pool = self.pool.recreate()
+        self.assertIsInstance(pool, InstrumentedQueuePool)
+        self.assertEqual(pool.max_overflow, 1)
+        pool.dispose()
+
+    def test_other_pool(self):
+        """ Report the status of a pool that is not a QueuePool """
+        pool = NullPool(lambda: sqlite3.connect(":memory:"))
+        self.assertIn("status", pool_status(pool))
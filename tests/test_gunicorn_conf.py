@@ -0,0 +1,57 @@
+"""
+Test cases for the gunicorn configuration
+
+"""
+import os
+import runpy
+import unittest
+from unittest.mock import patch
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def load_conf(**environ):
+    """ Runs gunicorn.conf.py with the given environment and returns its settings """
+    with patch.dict(os.environ, environ):
+        return runpy.run_path(CONF_PATH)
+
+######################################################################
+#  G U N I C O R N   C O N F   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(unittest.TestCase):
+    """ Test Cases for gunicorn.conf.py """
+
+    def test_web_concurrency(self):
+        """ WEB_CONCURRENCY sets the number of workers """
+        conf = load_conf(WEB_CONCURRENCY="3", PORT="5000")
+        self.assertEqual(conf["workers"], 3)
+        self.assertEqual(conf["bind"], "0.0.0.0:5000")
+        self.assertEqual(conf["worker_class"], "gthread")
+        self.assertTrue(conf["preload_app"])
+
+    def test_worker_count(self):
+        """ Size the workers from the CPUs and the memory limit """
+        conf = load_conf()
+        self.assertEqual(conf["worker_count"](2, None, 96), 5)
+        self.assertEqual(conf["worker_count"](4, 256, 96), 2)
+        self.assertEqual(conf["worker_count"](1, 64, 96), 1)
+
+    def test_memory_limit(self):
+        """ Read the Cloud Foundry memory limit """
+        memory_limit = load_conf()["memory_limit"]
+        with patch.dict(os.environ, {"MEMORY_LIMIT": "256m"}):
+            self.assertEqual(memory_limit(), 256)
+        with patch.dict(os.environ, {"MEMORY_LIMIT": "2G"}):
+            self.assertEqual(memory_limit(), 2048)
+
+    def test_threads_fit_the_pool(self):
+        """ A gthread worker never has more threads than database connections """
+        self.assertEqual(load_conf(GUNICORN_THREADS="8")["threads"], 8)
+        self.assertEqual(load_conf(GUNICORN_THREADS="8", DB_POOL_SIZE="2", DB_MAX_OVERFLOW="1")["threads"], 3)
+
+    def test_gevent(self):
+        """ Use gevent workers, or refuse an unknown worker class """
+        conf = load_conf(GUNICORN_WORKER_CLASS="gevent", GUNICORN_WORKER_CONNECTIONS="50")
+        self.assertEqual(conf["worker_connections"], 50)
+        self.assertNotIn("threads", conf)
+        self.assertRaises(ValueError, load_conf, GUNICORN_WORKER_CLASS="sync")
@@ -0,0 +1,129 @@
+"""
+Test cases for the log handlers
+
+"""
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+import unittest
+
+from flask import Flask
+
+from service.utils.log_handlers import (JsonFormatter, NonBlockingQueueHandler, SamplingFilter,
+                                        init_logging)
+
+
+def wait_for(predicate, timeout=2.0):
+    """ Waits until predicate() is true, returns its last value """
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def make_record(level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    """ Makes a log record like a logger would """
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+######################################################################
+#  L O G   H A N D L E R   T E S T   C A S E S
+######################################################################
+class TestLogHandlers(unittest.TestCase):
+    """ Test Cases for the log handlers """
+
+    def setUp(self):
+        """ This runs before each test """
+        self.log_file = tempfile.NamedTemporaryFile("r", suffix=".log")
+        self.gunicorn_logger = logging.getLogger(f"test.gunicorn.{self.id()}")
+        self.gunicorn_logger.setLevel(logging.INFO)
+        self.gunicorn_logger.handlers = [logging.FileHandler(self.log_file.name)]
+        self.app = Flask(__name__)
+        # every app of this module shares its logger
+        self.app.logger.handlers = []
+        self.app.logger.filters = []
+
+    def tearDown(self):
+        """ This runs after each test """
+        for handler in self.gunicorn_logger.handlers:
+            handler.close()
+        self.log_file.close()
+
+    def _written(self):
+        self.log_file.seek(0)
+        return self.log_file.read()
+
+    def test_json_formatter(self):
+        """ Format a record as JSON with its extra fields """
+        data = json.loads(JsonFormatter().format(make_record(db_queries=3)))
+        self.assertEqual(data["message"], "hello world")
+        self.assertEqual(data["level"], "INFO")
+        self.assertEqual(data["db_queries"], 3)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record(logging.ERROR)
+            record.exc_info = sys.exc_info()
+        self.assertIn("ValueError: boom", json.loads(JsonFormatter().format(record))["exception"])
+
+    def test_sampling_filter(self):
+        """ Sample the records below WARNING only """
+        never = SamplingFilter(0.0)
+        self.assertFalse(never.filter(make_record(logging.INFO)))
+        self.assertTrue(never.filter(make_record(logging.WARNING)))
+        self.assertTrue(SamplingFilter(1.0).filter(make_record(logging.DEBUG)))
+
+    def test_queue_full(self):
+        """ Drop records instead of waiting when the queue is full """
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        record = make_record()
+        handler.handle(record)
+        handler.handle(make_record())
+        self.assertEqual(handler.dropped, 1)
+        self.assertIs(handler.queue.get_nowait(), record)
+        self.assertEqual(record.args, ("world",))
+
+    def test_init_logging(self):
+        """ Write straight to the gunicorn handlers without a queue """
+        self.app.config["LOG_QUEUE"] = False
+        init_logging(self.app, self.gunicorn_logger.name)
+        self.assertEqual(self.app.logger.handlers, self.gunicorn_logger.handlers)
+        self.assertIn("[INFO] [log_handlers] Logging handler established", self._written())
+
+    def test_init_queue_logging(self):
+        """ Write through a queue and a background thread, as JSON """
+        self.app.config.update(LOG_QUEUE=True, LOG_FORMAT="json")
+        init_logging(self.app, self.gunicorn_logger.name)
+        self.assertIsInstance(self.app.logger.handlers[0], NonBlockingQueueHandler)
+        self.app.logger.warning("item %s", {"item_id": 1}, extra={"db_queries": 2})
+        self.assertTrue(wait_for(lambda: "item" in self._written()))
+        lines = [json.loads(line) for line in self._written().splitlines()]
+        self.assertEqual(lines[-1]["message"], "item {'item_id': 1}")
+        self.assertEqual(lines[-1]["db_queries"], 2)
+
+    def test_queue_logging_after_fork(self):
+        """ A forked process writes through a listener of its own """
+        self.app.config["LOG_QUEUE"] = True
+        init_logging(self.app, self.gunicorn_logger.name)
+        pid = os.fork()
+        if pid == 0:
+            self.app.logger.info("from the child")
+            os._exit(0 if wait_for(lambda: "from the child" in self._written()) else 1)
+        _, wait_status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(wait_status), 0)
+        self.app.logger.info("from the parent")
+        self.assertTrue(wait_for(lambda: "from the parent" in self._written()))
+
+    def test_sample_rate(self):
+        """ Keep no INFO records with a sample rate of 0 """
+        self.app.config.update(LOG_QUEUE=False, LOG_SAMPLE_RATE=0.0)
+        init_logging(self.app, self.gunicorn_logger.name)
+        self.app.logger.info("dropped")
+        self.app.logger.warning("kept")
+        self.assertNotIn("dropped", self._written())
+        self.assertIn("kept", self._written())
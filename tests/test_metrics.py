@@ -0,0 +1,36 @@
+"""
+Test cases for the request metrics
+
+"""
+import unittest
+
+from flask import Flask, request
+from flask_restx import Api, Resource
+
+from service.utils.metrics import resource_name
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestResourceName(unittest.TestCase):
+    """ Test Cases for resource_name """
+
+    def test_resource_name(self):
+        """ Label flask-restx resources by class and Flask views by endpoint """
+        app = Flask(__name__)
+        api = Api(app)
+
+        @api.route("/things")
+        class ThingCollection(Resource):  # pylint: disable=unused-variable
+            """ A flask-restx resource """
+            def get(self):
+                return []
+
+        @app.route("/plain")
+        def plain():  # pylint: disable=unused-variable
+            return ""
+
+        with app.test_request_context("/things"):
+            self.assertEqual(resource_name(app, request.endpoint), "ThingCollection")
+        self.assertEqual(resource_name(app, "plain"), "plain")
+        self.assertEqual(resource_name(app, None), "unmatched")
@@ -7,8 +7,10 @@ import unittest
 import os
 from werkzeug.exceptions import NotFound
 
-from sqlalchemy import null, true
-from service.models import Shopcart, DataValidationError, db
+from sqlalchemy import event, null, text, true
+from sqlalchemy.exc import IntegrityError
+from service.models import Shopcart, DataValidationError, VersionMismatchError, db
+from service.utils.cache import LRUCache
 from service import app
 from tests.factories import ItemFactory
 
@@ -30,11 +32,14 @@ class TestShopcart(unittest.TestCase):
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         # app.logger.setLevel(logging.CRITICAL)
         Shopcart.init_db(app)
+        cls.context = app.app_context()
+        cls.context.push()
 
     @classmethod
     def tearDownClass(cls):
         """ This runs once after the entire test suite """
         db.session.close()
+        cls.context.pop()
 
     def setUp(self):
         """ This runs before each test """
@@ -45,6 +50,7 @@ class TestShopcart(unittest.TestCase):
         """ This runs after each test """
         db.session.remove()
         db.drop_all()
+        Shopcart.cache = LRUCache()
 
     ######################################################################
     #  T E S T   C A S E S
@@ -97,6 +103,137 @@ class TestShopcart(unittest.TestCase):
         self.assertEqual(len(shopcarts), 2)
 
 
+    def test_create_many_items(self):
+        """ Create several items of a Shopcart in one transaction"""
+        shopcart = ItemFactory(item_id = 0)
+        items = [shopcart] + [ItemFactory(user_id = shopcart.user_id, item_id = i) for i in range(1, 5)]
+        created = Shopcart.create_many(items)
+        self.assertEqual(len(created), 5)
+        retrieved = Shopcart.find_shopcart(shopcart.user_id)
+        self.assertEqual(len(retrieved), 5)
+        self.assertCountEqual([item.item_id for item in retrieved], range(5))
+
+
+    def test_upsert(self):
+        """ Test Upsert inserts an item, then adds to its quantity """
+        item = ItemFactory(quantity = 2)
+        stored, inserted = Shopcart.upsert(item)
+        self.assertTrue(inserted)
+        self.assertEqual(stored.serialize(), item.serialize())
+        again = ItemFactory(user_id = item.user_id, item_id = item.item_id, quantity = 3)
+        stored, inserted = Shopcart.upsert(again)
+        self.assertFalse(inserted)
+        self.assertEqual(stored.quantity, 5)
+        self.assertEqual(stored.item_name, item.item_name)
+        self.assertEqual(len(Shopcart.all()), 1)
+        self.assertEqual(Shopcart.find_item(item.user_id, item.item_id).quantity, 5)
+
+
+    def test_set_hold(self):
+        """ Test Hold and resume items of a Shopcart in one UPDATE """
+        items = [ItemFactory(user_id = 1, item_id = item_id, hold = False) for item_id in (3, 1, 2)]
+        items.append(ItemFactory(user_id = 2, item_id = 1, hold = False))
+        Shopcart.create_many(items)
+        held = Shopcart.set_hold(1, True)
+        self.assertEqual([item.item_id for item in held], [1, 2, 3])
+        self.assertTrue(all(item.hold for item in held))
+        self.assertFalse(Shopcart.find_item(2, 1).hold)
+        resumed = Shopcart.set_hold(1, False, [2, 5])
+        self.assertEqual([item.item_id for item in resumed], [2])
+        db.session.remove()
+        self.assertEqual({item.item_id: item.hold for item in Shopcart.find_shopcart(1)}, {1: True, 2: False, 3: True})
+        self.assertEqual(Shopcart.set_hold(3, True), [])
+
+
+    def test_apply_operations(self):
+        """ Test Apply a batch of operations in one transaction """
+        Shopcart.create_many([ItemFactory(user_id = 1, item_id = item_id, quantity = 1, price = 2.0)
+                              for item_id in (1, 2, 3)])
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            applied, results = Shopcart.apply_operations(1, [
+                ("add", 4, ItemFactory(user_id = 1, item_id = 4)),
+                ("add", 5, ItemFactory(user_id = 1, item_id = 5)),
+                ("update", 1, {"quantity": 7}),
+                ("update", 2, {"price": 9.5}),
+                ("hold", 3, True),
+                ("hold", 4, True),
+                ("delete", 2, None),
+                ("delete", 6, None),
+            ])
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        self.assertTrue(applied)
+        self.assertEqual([code for code, _ in results], [201, 201, 200, 200, 200, 200, 204, 204])
+        self.assertEqual(results[2][1].quantity, 7)
+        self.assertEqual(results[3][1].price, 9.5)
+        self.assertTrue(results[5][1].hold)
+        # one statement per run of the same operation, and one for the version
+        self.assertEqual(len([sql for sql in statements if "shopcart" in sql]), 5)
+        db.session.remove()
+        items = {item.item_id: item for item in Shopcart.find_shopcart(1)}
+        self.assertEqual(sorted(items), [1, 3, 4, 5])
+        self.assertEqual((items[1].quantity, items[1].price), (7, 2.0))
+        self.assertTrue(items[3].hold and items[4].hold)
+
+
+    def test_apply_operations_all_or_nothing(self):
+        """ Test Nothing is kept when one operation does not apply """
+        Shopcart.create_many([ItemFactory(user_id = 1, item_id = 1, quantity = 1)])
+        applied, results = Shopcart.apply_operations(1, [
+            ("update", 1, {"quantity": 5}),
+            ("add", 1, ItemFactory(user_id = 1, item_id = 1)),
+            ("hold", 2, True),
+        ])
+        self.assertFalse(applied)
+        self.assertEqual([code for code, _ in results], [200, 409, 404])
+        db.session.remove()
+        self.assertEqual(Shopcart.find_item(1, 1).quantity, 1)
+
+
+    def test_apply_operations_same_item(self):
+        """ Test Operations on the same item are applied in order """
+        applied, results = Shopcart.apply_operations(1, [
+            ("add", 1, ItemFactory(user_id = 1, item_id = 1, hold = False)),
+            ("hold", 1, True),
+            ("hold", 1, False),
+            ("update", 1, {"quantity": 3}),
+            ("update", 1, {"price": 4.5}),
+        ])
+        self.assertTrue(applied)
+        self.assertFalse(results[2][1].hold)
+        item = results[-1][1]
+        self.assertEqual((item.quantity, item.price, item.hold), (3, 4.5, False))
+
+
+    def test_create_many_no_items(self):
+        """ Create an empty list of items"""
+        self.assertEqual(Shopcart.create_many([]), [])
+        self.assertEqual(Shopcart.all(), [])
+
+
+    def test_create_many_duplicate_items(self):
+        """ Create several items with a duplicate item id, nothing is written"""
+        shopcart = ItemFactory(item_id = 0)
+        items = [shopcart,
+                 ItemFactory(user_id = shopcart.user_id, item_id = 1),
+                 ItemFactory(user_id = shopcart.user_id, item_id = 0)]
+        self.assertRaises(DataValidationError, Shopcart.create_many, items)
+        self.assertEqual(Shopcart.all(), [])
+
+
+    def test_create_many_rolls_back(self):
+        """ Create several items when one already exists, nothing is written"""
+        existing = ItemFactory(item_id = 1)
+        existing.create()
+        items = [ItemFactory(user_id = existing.user_id, item_id = 0),
+                 ItemFactory(user_id = existing.user_id, item_id = 1)]
+        self.assertRaises(IntegrityError, Shopcart.create_many, items)
+        self.assertEqual(len(Shopcart.all()), 1)
+
+
     def test_update_a_item(self):
         """ Update a Shopcart, change item quantity"""
         item_in_shopcart = ItemFactory()
@@ -125,6 +262,57 @@ class TestShopcart(unittest.TestCase):
         self.assertEqual(len(Shopcart.all()), 0)
 
 
+    def test_delete_shopcart_with_items(self):
+        """ Delete all items of a Shopcart at once"""
+        shopcart = ItemFactory(item_id = 0)
+        other = ItemFactory(item_id = 0)
+        items = [shopcart] + [ItemFactory(user_id = shopcart.user_id, item_id = i) for i in range(1, 3)]
+        Shopcart.create_many(items + [other])
+        self.assertEqual(len(Shopcart.all()), 4)
+        count = Shopcart.delete_shopcart(shopcart.user_id)
+        self.assertEqual(count, 3)
+        self.assertEqual(Shopcart.find_shopcart(shopcart.user_id), [])
+        self.assertEqual(len(Shopcart.find_shopcart(other.user_id)), 1)
+
+
+    def test_delete_shopcart_not_found(self):
+        """ Delete a Shopcart that has no items"""
+        self.assertEqual(Shopcart.delete_shopcart(0), 0)
+
+
+    def test_replace_shopcart(self):
+        """ Replace the items of a Shopcart writing only what changed """
+        other = ItemFactory(user_id = 2, item_id = 1)
+        Shopcart.create_many([ItemFactory(user_id = 1, item_id = item_id, quantity = 1, price = 2.0)
+                              for item_id in (1, 2, 3)] + [other])
+        versions = dict(db.session.execute(text("SELECT item_id, xmin::text FROM shopcart WHERE user_id = 1")).all())
+        db.session.remove()
+        items = {item.item_id: item for item in Shopcart.find_shopcart(1)}
+        desired = [
+            Shopcart(**items[1].serialize()),
+            Shopcart(**dict(items[2].serialize(), quantity = 5)),
+            ItemFactory(user_id = 1, item_id = 4),
+        ]
+        counts = Shopcart.replace_shopcart(1, desired)
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1})
+        after = dict(db.session.execute(text("SELECT item_id, xmin::text FROM shopcart WHERE user_id = 1")).all())
+        self.assertEqual(sorted(after), [1, 2, 4])
+        # the unchanged row keeps its version, the updated one gets a new one
+        self.assertEqual(after[1], versions[1])
+        self.assertNotEqual(after[2], versions[2])
+        db.session.remove()
+        self.assertEqual(Shopcart.find_item(1, 2).quantity, 5)
+        self.assertEqual(len(Shopcart.find_shopcart(2)), 1)
+        self.assertEqual(Shopcart.replace_shopcart(1, [])["deleted"], 3)
+        self.assertEqual(Shopcart.find_shopcart(1), [])
+
+
+    def test_replace_shopcart_duplicates(self):
+        """ Replace the items of a Shopcart with an item given twice """
+        items = [ItemFactory(user_id = 1, item_id = 1), ItemFactory(user_id = 1, item_id = 1)]
+        self.assertRaises(DataValidationError, Shopcart.replace_shopcart, 1, items)
+
+
     def test_serialize_a_shopcart(self):
         """Test serialization of a Shopcart"""
         item_in_shopcart = ItemFactory()
@@ -341,3 +529,230 @@ class TestShopcart(unittest.TestCase):
         self.assertEqual(shopcart_list[1].user_id, shopcarts[2].user_id)
 
 
+
+
+    def test_all_shopcart_pages(self):
+        """Test return the non-empty shopcarts one page at a time"""
+        items = [ItemFactory(user_id = user_id, item_id = item_id)
+                 for user_id in (3, 1, 7, 5) for item_id in range(2)]
+        Shopcart.create_many(items)
+        self.assertEqual([row.user_id for row in Shopcart.all_shopcart()], [1, 3, 5, 7])
+        self.assertEqual([row.user_id for row in Shopcart.all_shopcart(limit=3)], [1, 3, 5])
+        self.assertEqual([row.user_id for row in Shopcart.all_shopcart(limit=3, after=5)], [7])
+        self.assertEqual(Shopcart.all_shopcart(limit=3, after=7), [])
+
+
+    def test_query_shopcarts_by_item_id_pages(self):
+        """Test return the shopcarts containing the item id one page at a time"""
+        items = [ItemFactory(user_id = user_id, item_id = 1) for user_id in (4, 2, 8, 6)]
+        items.append(ItemFactory(user_id = 5, item_id = 2))
+        Shopcart.create_many(items)
+        self.assertEqual([row.user_id for row in Shopcart.query_by_item_id(1, limit=2)], [2, 4])
+        self.assertEqual([row.user_id for row in Shopcart.query_by_item_id(1, limit=2, after=4)], [6, 8])
+        self.assertEqual([row.user_id for row in Shopcart.query_by_item_id(1, after=6)], [8])
+
+
+    def test_iter_user_ids(self):
+        """Test stream the user ids of the shopcarts in order"""
+        items = [ItemFactory(user_id = user_id, item_id = 1) for user_id in (4, 2, 8, 6)]
+        items.append(ItemFactory(user_id = 4, item_id = 2))
+        items.append(ItemFactory(user_id = 5, item_id = 2))
+        Shopcart.create_many(items)
+        self.assertEqual(list(Shopcart.iter_user_ids(chunk_size=2)), [2, 4, 5, 6, 8])
+        self.assertEqual(list(Shopcart.iter_user_ids(item_id=2, chunk_size=2)), [4, 5])
+        self.assertEqual(list(Shopcart.iter_user_ids(item_id=1, after=4)), [6, 8])
+
+
+    def test_find_shopcarts(self):
+        """ Test Finds many Shopcarts in chunks """
+        Shopcart.create_many([ItemFactory(user_id = user_id, item_id = item_id)
+                              for user_id in (1, 2, 3) for item_id in (2, 1)])
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            shopcarts = Shopcart.find_shopcarts([3, 9, 1, 3, 2], chunk_size=2)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        self.assertEqual(list(shopcarts), [3, 9, 1, 2])
+        self.assertEqual(shopcarts[9], [])
+        self.assertEqual([item.item_id for item in shopcarts[1]], [1, 2])
+        self.assertTrue(all(item.user_id == 2 for item in shopcarts[2]))
+        self.assertEqual(len(statements), 2)
+
+
+    def test_find_shopcarts_cached(self):
+        """ Test Finds many Shopcarts, some of them from the cache """
+        Shopcart.cache = LRUCache(10)
+        Shopcart.create_many([ItemFactory(user_id = user_id, item_id = 1) for user_id in (1, 2)])
+        Shopcart.find_shopcart(1)
+        shopcarts = Shopcart.find_shopcarts([1, 2, 3])
+        self.assertEqual([len(items) for items in shopcarts.values()], [1, 1, 0])
+        self.assertEqual(Shopcart.cache.stats()["hits"], 1)
+        shopcarts = Shopcart.find_shopcarts([2, 3])
+        self.assertEqual(Shopcart.cache.stats()["hits"], 3)
+
+
+    def test_find_item_in_shopcart(self):
+        """ Test Find an item and tell a missing Shopcart from a missing item """
+        shopcart = ItemFactory(item_id = 3)
+        Shopcart.create_many([ItemFactory(user_id = shopcart.user_id, item_id = 1), shopcart])
+        found, item = Shopcart.find_item_in_shopcart(shopcart.user_id, 3)
+        self.assertTrue(found)
+        self.assertEqual(item.serialize(), shopcart.serialize())
+        self.assertEqual(Shopcart.find_item_in_shopcart(shopcart.user_id, 2), (True, None))
+        self.assertEqual(Shopcart.find_item_in_shopcart(shopcart.user_id + 1, 3), (False, None))
+
+
+    def test_find_item_in_shopcart_cached(self):
+        """ Test Find an item in a cached Shopcart """
+        Shopcart.cache = LRUCache(10)
+        shopcart = ItemFactory(item_id = 0)
+        shopcart.create()
+        Shopcart.find_shopcart(shopcart.user_id)
+        found, item = Shopcart.find_item_in_shopcart(shopcart.user_id, 0)
+        self.assertTrue(found)
+        self.assertEqual(item.item_name, shopcart.item_name)
+        self.assertEqual(Shopcart.find_item_in_shopcart(shopcart.user_id, 1), (True, None))
+        self.assertEqual(Shopcart.cache.stats()["hits"], 2)
+
+
+    def test_versions(self):
+        """ Test Every change to a Shopcart moves its version on """
+        self.assertEqual(Shopcart.get_version(1), 0)
+        self.assertEqual(ItemFactory(user_id = 1, item_id = 1).create(), 1)
+        Shopcart.create_many([ItemFactory(user_id = 1, item_id = 2), ItemFactory(user_id = 2, item_id = 1)])
+        self.assertEqual((Shopcart.get_version(1), Shopcart.get_version(2)), (2, 1))
+        Shopcart.upsert(ItemFactory(user_id = 1, item_id = 2))
+        Shopcart.set_hold(1, True)
+        Shopcart.apply_operations(1, [("delete", 2, None)])
+        item = Shopcart.find_item(1, 1, cached=False)
+        item.quantity += 1
+        self.assertEqual(item.save(), 6)
+        self.assertEqual(Shopcart.replace_shopcart(1, [ItemFactory(user_id = 1, item_id = 3)])["deleted"], 1)
+        self.assertEqual(Shopcart.delete_shopcart(1), 1)
+        self.assertEqual(Shopcart.get_version(1), 8)
+        # nothing changed, so the version stays
+        Shopcart.delete_shopcart(1)
+        Shopcart.set_hold(1, True)
+        Shopcart.apply_operations(1, [("hold", 1, True)])
+        self.assertEqual(Shopcart.get_version(1), 8)
+        self.assertEqual(Shopcart.get_version(2), 1)
+
+
+    def test_save_expected_version(self):
+        """ Test Save and delete only at the expected version """
+        ItemFactory(user_id = 1, item_id = 1, quantity = 1).create()
+        item = Shopcart.find_item(1, 1, cached=False)
+        item.quantity = 2
+        self.assertRaises(VersionMismatchError, item.save, 0)
+        db.session.remove()
+        self.assertEqual(Shopcart.find_item(1, 1).quantity, 1)
+        item = Shopcart.find_item(1, 1, cached=False)
+        item.quantity = 2
+        self.assertEqual(item.save(1), 2)
+        self.assertRaises(VersionMismatchError, Shopcart.find_item(1, 1, cached=False).delete, 1)
+        db.session.remove()
+        self.assertEqual(Shopcart.find_item(1, 1, cached=False).delete(2), 3)
+        self.assertEqual(Shopcart.find_shopcart(1), [])
+        # a Shopcart that never changed is at version 0
+        self.assertEqual(ItemFactory(user_id = 2, item_id = 1).create(), 1)
+        item = ItemFactory(user_id = 3, item_id = 1)
+        db.session.add(item)
+        self.assertEqual(Shopcart._commit(3, expected_version=0), 1)
+
+
+    def test_find_shopcart_at(self):
+        """ Test Finds a Shopcart from the cache only at the same version """
+        Shopcart.cache = LRUCache(10)
+        ItemFactory(user_id = 1, item_id = 1).create()
+        version = Shopcart.get_version(1)
+        self.assertEqual(len(Shopcart.find_shopcart_at(1, version)), 1)
+        self.assertEqual(len(Shopcart.find_shopcart_at(1, version)), 1)
+        self.assertEqual(Shopcart.cache.stats()["hits"], 1)
+        # another worker adds an item, this cache does not know
+        db.session.execute(text("INSERT INTO shopcart VALUES (1, 2, 'ring', 1, 1.5, false)"))
+        db.session.execute(text("UPDATE shopcart_version SET version = version + 1"))
+        db.session.commit()
+        self.assertEqual(len(Shopcart.find_shopcart(1)), 1)
+        self.assertEqual(len(Shopcart.find_shopcart_at(1, Shopcart.get_version(1))), 2)
+
+
+    def test_find_shopcart_cached(self):
+        """ Test Finds a Shopcart from the cache on the second lookup """
+        Shopcart.cache = LRUCache(10)
+        shopcart = ItemFactory(item_id = 0)
+        Shopcart.create_many([shopcart, ItemFactory(user_id = shopcart.user_id, item_id = 1)])
+        self.assertEqual(len(Shopcart.find_shopcart(shopcart.user_id)), 2)
+        db.session.remove()
+        retrieved = Shopcart.find_shopcart(shopcart.user_id)
+        self.assertEqual(len(retrieved), 2)
+        self.assertEqual(retrieved[0].item_name, shopcart.item_name)
+        self.assertEqual(retrieved[0].quantity, shopcart.quantity)
+        item = Shopcart.find_item(shopcart.user_id, 1)
+        self.assertEqual(item.item_id, 1)
+        self.assertIsNone(Shopcart.find_item(shopcart.user_id, 2))
+        stats = Shopcart.cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 3)
+
+
+    def test_cached_item_update(self):
+        """ Test Update an item of a cached Shopcart and invalidate it """
+        Shopcart.cache = LRUCache(10)
+        shopcart = ItemFactory(item_id = 0, quantity = 1)
+        shopcart.create()
+        Shopcart.find_shopcart(shopcart.user_id)
+        db.session.remove()
+        item = Shopcart.find_item(shopcart.user_id, 0, cached=False)
+        item.quantity = 5
+        item.save()
+        self.assertEqual(Shopcart.cache.stats()["size"], 0)
+        db.session.remove()
+        self.assertEqual(Shopcart.find_item(shopcart.user_id, 0).quantity, 5)
+        self.assertEqual(Shopcart.find_shopcart(shopcart.user_id)[0].quantity, 5)
+
+
+    def test_cached_item_deleted_elsewhere(self):
+        """ Test a cached item deleted by another worker is not written back """
+        Shopcart.cache = LRUCache(10)
+        user_id = ItemFactory().user_id
+        Shopcart(user_id = user_id, item_id = 0, item_name = "ring", quantity = 1, price = 1.5).create()
+        Shopcart.find_shopcart(user_id)
+        # another worker deletes the row without touching this cache
+        db.session.execute(Shopcart.__table__.delete())
+        db.session.commit()
+        item = Shopcart.find_item(user_id, 0)
+        self.assertNotIn(item, db.session)
+        item.hold = True
+        item.save()
+        self.assertIsNone(Shopcart.find_item(user_id, 0, cached=False))
+
+
+    def test_cache_invalidated_on_writes(self):
+        """ Test every write to a Shopcart drops its cache entry """
+        Shopcart.cache = LRUCache(10)
+        user_id = ItemFactory().user_id
+        Shopcart(user_id = user_id, item_id = 0, item_name = "ring", quantity = 1, price = 1.5).create()
+        self.assertEqual(len(Shopcart.find_shopcart(user_id)), 1)
+        ItemFactory(user_id = user_id, item_id = 1).create()
+        self.assertEqual(len(Shopcart.find_shopcart(user_id)), 2)
+        Shopcart.create_many([ItemFactory(user_id = user_id, item_id = 2)])
+        self.assertEqual(len(Shopcart.find_shopcart(user_id)), 3)
+        Shopcart.find_item(user_id, 2, cached=False).delete()
+        self.assertEqual(len(Shopcart.find_shopcart(user_id)), 2)
+        Shopcart.delete_shopcart(user_id)
+        self.assertEqual(Shopcart.find_shopcart(user_id), [])
+
+    def test_pool_disposed_after_fork(self):
+        """ A forked process does not reuse the pooled connections """
+        db.session.execute(text("SELECT 1"))
+        pool = db.engine.pool
+        pid = os.fork()
+        if pid == 0:
+            # the child reports through its exit code, without any cleanup
+            os._exit(0 if db.engine.pool is not pool and pool.checkedout() == 1 else 1)
+        _, wait_status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(wait_status), 0)
+        self.assertIs(db.engine.pool, pool)
+        self.assertEqual(db.session.execute(text("SELECT 1")).scalar(), 1)
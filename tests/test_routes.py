@@ -37,11 +37,14 @@ class TestYourResourceServer(TestCase):
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         app.logger.setLevel(logging.CRITICAL)
         init_db()
+        cls.context = app.app_context()
+        cls.context.push()
 
     @classmethod
     def tearDownClass(cls):
         """ This runs once after the entire test suite """
         db.session.close()
+        cls.context.pop()
 
     def setUp(self):
         """ This runs before each test """
@@ -86,6 +89,43 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
 
 
+    def test_stats(self):
+        """ Test the pool and cache statistics """
+        self._create_items(2)
+        resp = self.app.get("/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["pool"]["size"], app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"])
+        self.assertGreater(data["pool"]["checkouts"], 0)
+        self.assertIn("wait_max_seconds", data["pool"])
+        self.assertIn("overflow", data["pool"])
+        self.assertIn("hits", data["cache"])
+        self.assertCountEqual(data["startup"]["steps"], ["config", "routes", "database"])
+
+
+    def test_metrics(self):
+        """ Test the Prometheus metrics of the requests """
+        user_id = self._create_items(1)[0].user_id
+        self.app.get(f"{BASE_URL}/{user_id}")
+        resp = self.app.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        text = resp.get_data(as_text=True)
+        self.assertIn('shopcart_request_duration_seconds_count{method="get",resource="ShopcartResource",status="200"}',
+                      text)
+        self.assertIn('shopcart_request_duration_seconds_count{method="post",resource="ShopcartCollection",status="201"}',
+                      text)
+        self.assertRegex(text, r'shopcart_request_db_queries_count\{method="get",resource="ShopcartResource"\} [1-9]')
+        self.assertIn('shopcart_db_pool{state="size"}', text)
+
+
+    def test_server_timing(self):
+        """ Test the SQL statements of a request in Server-Timing """
+        user_id = self._create_items(1)[0].user_id
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        self.assertRegex(resp.headers["Server-Timing"], r'^db;desc="[1-9]\d* queries";dur=')
+
+
     def test_method_not_supported(self):
         """Test Method Not Supported"""
         resp = self.app.put(BASE_URL, json={}, content_type=CONTENT_TYPE_JSON)
@@ -108,6 +148,37 @@ class TestYourResourceServer(TestCase):
         self.assertCountEqual(data, [dict1,dict2])
 
 
+    def test_get_shopcart_list_pages(self):
+        """Get a list of Shopcart one page at a time"""
+        user_ids = sorted(self._create_items(1)[0].user_id for _ in range(5))
+        resp = self.app.get(f"{BASE_URL}?limit=2")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), [{'user_id': user_id} for user_id in user_ids[:2]])
+        seen = [row['user_id'] for row in resp.get_json()]
+        while "Link" in resp.headers:
+            link = resp.headers["Link"]
+            self.assertTrue(link.endswith('>; rel="next"'))
+            resp = self.app.get(link[1:link.index(">")])
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            seen.extend(row['user_id'] for row in resp.get_json())
+        self.assertEqual(seen, user_ids)
+
+
+    def test_get_shopcart_list_default_page(self):
+        """Get a list of Shopcart without a limit uses the default page size"""
+        user_ids = sorted(self._create_items(1)[0].user_id for _ in range(3))
+        with patch.dict(app.config, {"SHOPCART_PAGE_SIZE": 2}):
+            resp = self.app.get(BASE_URL)
+        self.assertEqual(resp.get_json(), [{'user_id': user_id} for user_id in user_ids[:2]])
+        self.assertIn(f"after={user_ids[1]}", resp.headers["Link"])
+
+
+    def test_get_shopcart_list_bad_limit(self):
+        """Get a list of Shopcart with a limit that is not positive"""
+        resp = self.app.get(f"{BASE_URL}?limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
     def test_get_shopcart(self):
         """Get a shopcart"""
         # get the items of a shopcart
@@ -125,6 +196,53 @@ class TestYourResourceServer(TestCase):
             self.assertEqual(data[i]['price'], test_shopcart[i].price)
 
 
+    def test_search_shopcarts(self):
+        """Get many Shopcarts at once"""
+        shopcart1 = self._create_items(2)
+        shopcart2 = self._create_items(1)
+        user_ids = [shopcart2[0].user_id, 10**6, shopcart1[0].user_id]
+        resp = self.app.post(f"{BASE_URL}/search", json={"user_ids": user_ids},
+                             content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([shopcart['user_id'] for shopcart in data], user_ids)
+        self.assertEqual(data[0]['items'], [item.serialize() for item in shopcart2])
+        self.assertEqual(data[1]['items'], [])
+        self.assertEqual([item['item_id'] for item in data[2]['items']],
+                         sorted(item.item_id for item in shopcart1))
+
+
+    def test_search_shopcarts_bad_user_ids(self):
+        """Get many Shopcarts with bad or too many user ids"""
+        for body in ({}, {"user_ids": 1}, {"user_ids": [-1]}, {"user_ids": ["1"]}):
+            resp = self.app.post(f"{BASE_URL}/search", json=body, content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, body)
+        with patch.dict(app.config, {"SHOPCART_SEARCH_MAX": 2}):
+            resp = self.app.post(f"{BASE_URL}/search", json={"user_ids": [1, 2, 3]},
+                                 content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_get_shopcart_etag(self):
+        """Get a Shopcart again with its ETag"""
+        test_shopcart = self._create_items(2)
+        url = f"{BASE_URL}/{test_shopcart[0].user_id}"
+        resp = self.app.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+        etag = resp.headers["ETag"]
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.headers["ETag"], etag)
+        self.assertEqual(resp.data, b"")
+        resp = self.app.put(f"{url}/items/{test_shopcart[0].item_id}", json={"quantity": 3},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        resp = self.app.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+
+
     def test_get_shopcart_empty(self):
         """Get an empty Shopcart"""
         resp = self.app.get("/shopcarts/0")
@@ -279,6 +397,9 @@ class TestYourResourceServer(TestCase):
                 content_type=CONTENT_TYPE_JSON
         )
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        # make sure nothing was written
+        resp = self.app.get(f"{BASE_URL}/{item.user_id}")
+        self.assertEqual(resp.get_json(), [])
 
 
     ######################################################################
@@ -302,6 +423,8 @@ class TestYourResourceServer(TestCase):
             content_type = "shopcarts/json"
         )
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        resp = self.app.get("/shopcarts/{}".format(shopcart[0].user_id))
+        self.assertEqual(resp.get_json(), [])
 
 
     def test_delete_shopcart_not_found(self):
@@ -310,6 +433,30 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
 
 
+    def test_replace_shopcart(self):
+        """Replace the items of a Shopcart"""
+        shopcart = self._create_items(2)
+        user_id = shopcart[0].user_id
+        kept = dict(shopcart[0].serialize(), quantity=shopcart[0].quantity + 1)
+        added = ItemFactory(user_id=user_id, item_id=shopcart[1].item_id + 1).serialize()
+        resp = self.app.put(f"{BASE_URL}/{user_id}", json={"items": [added, kept]},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), [kept, added])
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        self.assertCountEqual(resp.get_json(), [kept, added])
+
+
+    def test_replace_shopcart_bad_data(self):
+        """Replace the items of a Shopcart with bad data"""
+        item = ItemFactory().serialize()
+        for body in ([item], {"items": item}, {"items": [1]},
+                     {"items": [dict(item, quantity=0)]}, {"items": [item, item]}):
+            resp = self.app.put(f"{BASE_URL}/{item['user_id']}", json=body,
+                                content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, body)
+
+
     ######################################################################
     # TEST CREATE ITEM
     ######################################################################
@@ -401,6 +548,19 @@ class TestYourResourceServer(TestCase):
         logging.debug(resp)
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_shopcart_bad_items(self):
+        """Create a Shopcart with several bad items reports all of them"""
+        items = [ItemFactory().serialize() for _ in range(3)]
+        items[0]["price"] = "foo"
+        del items[2]["item_name"]
+        resp = self.app.post(BASE_URL, json={"user_id": 1, "items": items},
+                             content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.get_json()["errors"], [
+            {"index": 0, "field": "price", "message": "must be a number"},
+            {"index": 2, "field": "item_name", "message": "is required"},
+        ])
+
     def test_crete_item_invalid_shopcartID(self):
         """Attempts to create an item with a negative float shopcart_id in url """
         req = ItemFactory().serialize()
@@ -434,6 +594,92 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
 
 
+    def test_create_item_merge(self):
+        """ Adds an item twice with merge=true """
+        req = ItemFactory(quantity=2).serialize()
+        user_id = req.pop("user_id")
+        url = BASE_URL + "/" + str(user_id) + "/items?merge=true"
+        resp = self.app.post(url, json=req, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.get_json()["quantity"], 2)
+        req["quantity"] = 3
+        resp = self.app.post(url, json=req, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json()["quantity"], 5)
+        resp = self.app.get(f"{BASE_URL}/{user_id}/items/{req['item_id']}")
+        self.assertEqual(resp.get_json()["quantity"], 5)
+
+
+    def test_create_item_merge_bad_quantity(self):
+        """ Attempts to merge an item with a non-positive quantity """
+        req = ItemFactory().serialize()
+        user_id = req.pop("user_id")
+        req["quantity"] = -1
+        resp = self.app.post(f"{BASE_URL}/{user_id}/items?merge=true",
+                             json=req, content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_patch_items(self):
+        """ Applies a batch of item operations """
+        test_shopcart = self._create_items(2)
+        user_id = test_shopcart[0].user_id
+        new_item = ItemFactory(user_id=user_id, item_id=test_shopcart[1].item_id + 1).serialize()
+        operations = [
+            dict(new_item, op="add"),
+            {"op": "update", "item_id": test_shopcart[0].item_id, "quantity": 4},
+            {"op": "hold", "item_id": test_shopcart[0].item_id},
+            {"op": "delete", "item_id": test_shopcart[1].item_id},
+        ]
+        resp = self.app.patch(f"{BASE_URL}/{user_id}/items", json=operations,
+                              content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([result["status_code"] for result in data], [201, 200, 200, 204])
+        self.assertEqual(data[1]["item"]["quantity"], 4)
+        self.assertTrue(data[2]["item"]["hold"])
+        self.assertIsNone(data[3]["item"])
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        items = {item["item_id"]: item for item in resp.get_json()}
+        self.assertEqual(sorted(items), [test_shopcart[0].item_id, new_item["item_id"]])
+        self.assertEqual(items[test_shopcart[0].item_id]["quantity"], 4)
+
+
+    def test_patch_items_conflict(self):
+        """ Applies a batch of item operations where one does not apply """
+        test_shopcart = self._create_items(1)
+        user_id = test_shopcart[0].user_id
+        operations = [
+            {"op": "delete", "item_id": test_shopcart[0].item_id},
+            {"op": "update", "item_id": test_shopcart[0].item_id + 1, "price": 2.5},
+        ]
+        resp = self.app.patch(f"{BASE_URL}/{user_id}/items", json=operations,
+                              content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual([result["status_code"] for result in resp.get_json()], [204, 404])
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        self.assertEqual(len(resp.get_json()), 1)
+
+
+    def test_patch_items_bad_operations(self):
+        """ Attempts to apply invalid item operations """
+        user_id = self._create_items(1)[0].user_id
+        url = f"{BASE_URL}/{user_id}/items"
+        for operations in ([], {"op": "delete", "item_id": 1},
+                           [{"op": "replace", "item_id": 1}],
+                           [{"op": "delete", "item_id": -1}],
+                           [{"op": "add", "item_id": 1, "item_name": "ring", "quantity": 0, "price": 1.0}],
+                           [{"op": "update", "item_id": 1}],
+                           [{"op": "update", "item_id": 1, "price": "free"}],
+                           [{"op": "hold", "item_id": 1, "hold": "yes"}]):
+            resp = self.app.patch(url, json=operations, content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, operations)
+        with patch.dict(app.config, {"SHOPCART_OPERATIONS_MAX": 1}):
+            resp = self.app.patch(url, json=[{"op": "delete", "item_id": 1}] * 2,
+                                  content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
     ######################################################################
     # TEST READ ITEM
     ######################################################################
@@ -971,6 +1217,7 @@ class TestYourResourceServer(TestCase):
         )
         logging.debug(resp)
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), dict(req, user_id=user_id, hold=True))
 
 
     def test_hold_nonexistent_itemid(self):
@@ -1072,6 +1319,7 @@ class TestYourResourceServer(TestCase):
         )
         logging.debug(resp)
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), dict(req, user_id=user_id, hold=False))
 
 
     def test_resume_nonexistent_itemid(self):
@@ -1148,6 +1396,105 @@ class TestYourResourceServer(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND) # still same response
 
 
+    def test_hold_shopcart(self):
+        """Hold every item of a shopcart, then resume them"""
+        test_shopcart = self._create_items(3)
+        user_id = test_shopcart[0].user_id
+        resp = self.app.put(f"{BASE_URL}/{user_id}/hold")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([item['item_id'] for item in data], [item.item_id for item in test_shopcart])
+        self.assertTrue(all(item['hold'] for item in data))
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        self.assertTrue(all(item['hold'] for item in resp.get_json()))
+        resp = self.app.put(f"{BASE_URL}/{user_id}/resume")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(item['hold'] for item in resp.get_json()))
+
+
+    def test_hold_shopcart_item_ids(self):
+        """Hold a list of items of a shopcart"""
+        test_shopcart = self._create_items(3)
+        user_id = test_shopcart[0].user_id
+        item_ids = [test_shopcart[0].item_id, test_shopcart[2].item_id, 10**6]
+        resp = self.app.put(f"{BASE_URL}/{user_id}/hold", json={"item_ids": item_ids},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['item_id'] for item in resp.get_json()], item_ids[:2])
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        self.assertEqual({item['item_id']: item['hold'] for item in resp.get_json()},
+                         {item.item_id: hold for item, hold in zip(test_shopcart, [True, False, True])})
+        resp = self.app.put(f"{BASE_URL}/{user_id}/resume", json={"item_ids": item_ids[:1]},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual([item['item_id'] for item in resp.get_json()], item_ids[:1])
+        resp = self.app.get(f"{BASE_URL}/{user_id}")
+        self.assertEqual({item['item_id']: item['hold'] for item in resp.get_json()},
+                         {item.item_id: hold for item, hold in zip(test_shopcart, [False, False, True])})
+
+
+    def test_hold_shopcart_not_found(self):
+        """Hold the items of an empty shopcart or unknown items"""
+        resp = self.app.put(f"{BASE_URL}/0/hold")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        user_id = self._create_items(1)[0].user_id
+        resp = self.app.put(f"{BASE_URL}/{user_id}/resume", json={"item_ids": []},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_hold_shopcart_bad_item_ids(self):
+        """Hold items with item ids that are not a list of non-negative ints"""
+        user_id = self._create_items(1)[0].user_id
+        for item_ids in ("1", [-1], [1.5], [True]):
+            resp = self.app.put(f"{BASE_URL}/{user_id}/hold", json={"item_ids": item_ids},
+                                content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.app.put(f"{BASE_URL}/{user_id}/hold", data="[1]", content_type="text/plain")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+    def test_update_item_if_match(self):
+        """Update an item only when the Shopcart has the expected ETag"""
+        test_shopcart = self._create_items(1)
+        url = f"{BASE_URL}/{test_shopcart[0].user_id}"
+        etag = self.app.get(url).headers["ETag"]
+        item_url = f"{url}/items/{test_shopcart[0].item_id}"
+        resp = self.app.put(item_url, json={"quantity": 3}, headers={"If-Match": etag},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        new_etag = resp.headers["ETag"]
+        # a second client still holding the first ETag
+        resp = self.app.put(item_url, json={"quantity": 5}, headers={"If-Match": etag},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.put(item_url, json={"quantity": 5}, headers={"If-Match": "W/" + new_etag},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.app.get(item_url).get_json()["quantity"], 3)
+        resp = self.app.put(item_url, json={"quantity": 5}, headers={"If-Match": "*"},
+                            content_type=CONTENT_TYPE_JSON)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+
+    def test_delete_item_if_match(self):
+        """Delete an item only when the Shopcart has the expected ETag"""
+        test_shopcart = self._create_items(2)
+        url = f"{BASE_URL}/{test_shopcart[0].user_id}"
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.delete(f"{url}/items/{test_shopcart[0].item_id}", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        resp = self.app.delete(f"{url}/items/{test_shopcart[1].item_id}", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(len(self.app.get(url).get_json()), 1)
+        # deleting an item that is gone still checks the ETag
+        resp = self.app.delete(f"{url}/items/{test_shopcart[0].item_id}", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        etag = self.app.get(url).headers["ETag"]
+        resp = self.app.delete(f"{url}/items/{test_shopcart[0].item_id}", headers={"If-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(resp.headers["ETag"], etag)
+
+
     ######################################################################
     # TEST QUERY SHOPCARTS
     ######################################################################
@@ -1176,3 +1523,47 @@ class TestYourResourceServer(TestCase):
         dict1 = {'user_id': shopcart1[0].user_id}
         dict2 = {'user_id': shopcart2[0].user_id}
         self.assertCountEqual(data, [dict1, dict2])
+
+
+    def test_query_shopcarts_pages(self):
+        """Attempts querying shopcarts one page at a time"""
+        shopcarts = [self._create_items(1) for _ in range(3)]
+        # every cart already holds the factory's item, so share another one
+        item_id = shopcarts[0][0].item_id + 1
+        for shopcart in shopcarts:
+            resp = self.app.post(f"{BASE_URL}/{shopcart[0].user_id}/items",
+                                 json=ItemFactory(item_id = item_id).serialize(),
+                                 content_type=CONTENT_TYPE_JSON)
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        user_ids = sorted(shopcart[0].user_id for shopcart in shopcarts)
+        resp = self.app.get(f"{BASE_URL}?item-id={item_id}&limit=2")
+        self.assertEqual(resp.get_json(), [{'user_id': user_id} for user_id in user_ids[:2]])
+        link = resp.headers["Link"]
+        self.assertIn(f"item-id={item_id}", link)
+        resp = self.app.get(link[1:link.index(">")])
+        self.assertEqual(resp.get_json(), [{'user_id': user_ids[2]}])
+        self.assertNotIn("Link", resp.headers)
+
+
+    def test_get_shopcart_list_stream(self):
+        """Stream the whole list of Shopcart in one response"""
+        user_ids = sorted(self._create_items(1)[0].user_id for _ in range(5))
+        with patch.dict(app.config, {"SHOPCART_STREAM_CHUNK_SIZE": 2}):
+            resp = self.app.get(f"{BASE_URL}?stream=true")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertTrue(resp.is_streamed)
+            self.assertEqual(resp.get_json(), [{'user_id': user_id} for user_id in user_ids])
+            self.assertNotIn("Link", resp.headers)
+            resp = self.app.get(f"{BASE_URL}?stream=true&after={user_ids[2]}")
+            self.assertEqual(resp.get_json(), [{'user_id': user_id} for user_id in user_ids[3:]])
+
+
+    def test_query_shopcarts_stream(self):
+        """Stream the Shopcarts containing an item"""
+        shopcarts = [self._create_items(1) for _ in range(2)]
+        item_id = shopcarts[0][0].item_id
+        resp = self.app.get(f"{BASE_URL}?item-id={item_id}&stream=true")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(resp.get_json(), [{'user_id': shopcart[0].user_id} for shopcart in shopcarts])
+        resp = self.app.get(f"{BASE_URL}?item-id={item_id + 1}&stream=true")
+        self.assertEqual(resp.get_json(), [])
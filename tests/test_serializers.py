@@ -0,0 +1,88 @@
+"""
+Test cases for the compiled serializers and the JSON encoders
+
+"""
+import json
+import unittest
+from types import SimpleNamespace
+
+from flask_restx import Model, fields, marshal
+
+from service.utils.json_encoding import get_encoder, stdlib_dumps
+from service.utils.serializers import compile_serializer
+
+ITEM = Model('Item', {
+    'item_id': fields.Integer,
+    'item_name': fields.String,
+    'price': fields.Float,
+    'hold': fields.Boolean,
+})
+
+
+
+def Item(item_id, item_name, price, hold, user_id):
+    """ Makes an object with the attributes of a Shopcart item """
+    return SimpleNamespace(item_id=item_id, item_name=item_name, price=price, hold=hold, user_id=user_id)
+
+######################################################################
+#  S E R I A L I Z E R   T E S T   C A S E S
+######################################################################
+class TestCompileSerializer(unittest.TestCase):
+    """ Test Cases for compile_serializer """
+
+    def test_serialize(self):
+        """ Serialize an object like marshal() does """
+        serialize = compile_serializer(ITEM)
+        item = Item(1, "ring", 10, False, 7)
+        self.assertEqual(serialize(item), {'item_id': 1, 'item_name': "ring", 'price': 10.0, 'hold': False})
+        self.assertIsInstance(serialize(item)['price'], float)
+        self.assertEqual(serialize(item), marshal(item, ITEM))
+        self.assertEqual(list(serialize(item)), list(ITEM))
+
+    def test_serialize_none(self):
+        """ Serialize an object with missing values """
+        serialize = compile_serializer(ITEM)
+        self.assertEqual(serialize(Item(1, None, None, None, 7)),
+                         {'item_id': 1, 'item_name': None, 'price': None, 'hold': None})
+
+    def test_serialize_one_field(self):
+        """ Serialize with a model of a single field """
+        serialize = compile_serializer(Model('Shopcart', {'user_id': fields.Integer}))
+        self.assertEqual(serialize(Item(1, "ring", 1.0, False, 7)), {'user_id': 7})
+
+    def test_attribute(self):
+        """ Serialize a field read from another attribute """
+        serialize = compile_serializer(Model('Shopcart', {'id': fields.Integer(attribute='user_id'),
+                                                          'name': fields.String(attribute='item_name')}))
+        self.assertEqual(serialize(Item(1, "ring", 1.0, False, 7)), {'id': 7, 'name': "ring"})
+
+    def test_not_flat(self):
+        """ Refuse models with nested fields """
+        model = Model('Shopcart', {'items': fields.List(fields.Nested(ITEM))})
+        self.assertRaises(ValueError, compile_serializer, model)
+
+
+######################################################################
+#  J S O N   E N C O D I N G   T E S T   C A S E S
+######################################################################
+class TestGetEncoder(unittest.TestCase):
+    """ Test Cases for get_encoder """
+
+    def test_encoders(self):
+        """ Every encoder writes the same JSON """
+        data = [{'user_id': 1, 'price': 2.5, 'hold': True, 'item_name': "ringé", 'none': None}]
+        for name in ("auto", "json", "orjson"):
+            try:
+                dumps = get_encoder(name)
+            except ValueError:
+                continue
+            self.assertIsInstance(dumps(data), bytes)
+            self.assertEqual(json.loads(dumps(data)), data)
+
+    def test_stdlib(self):
+        """ Ask for the standard library encoder """
+        self.assertIs(get_encoder("json"), stdlib_dumps)
+
+    def test_unknown(self):
+        """ Ask for an encoder that does not exist """
+        self.assertRaises(ValueError, get_encoder, "simplejson")
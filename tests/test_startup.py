@@ -0,0 +1,37 @@
+"""
+Test cases for the startup timer
+
+"""
+import os
+import unittest
+from unittest.mock import patch
+
+from service.utils.startup import StartupTimer
+
+######################################################################
+#  S T A R T U P   T E S T   C A S E S
+######################################################################
+class TestStartupTimer(unittest.TestCase):
+    """ Test Cases for StartupTimer """
+
+    def test_mark(self):
+        """ Mark the steps of a startup """
+        with patch("service.utils.startup.time.perf_counter", side_effect=[10.0, 10.5, 12.0]):
+            timer = StartupTimer()
+            self.assertEqual(timer.mark("config"), 0.5)
+            self.assertEqual(timer.mark("routes"), 1.5)
+        self.assertEqual(timer.total, 2.0)
+        self.assertEqual(timer.snapshot(), {
+            "pid": os.getpid(),
+            "steps": {"config": 0.5, "routes": 1.5},
+            "total_seconds": 2.0,
+        })
+
+    def test_forked(self):
+        """ Time the steps of a forked worker from the fork """
+        with patch("service.utils.startup.time.perf_counter", side_effect=[0.0, 1.0, 5.0, 5.25]):
+            timer = StartupTimer()
+            timer.mark("config")
+            timer.forked()
+            timer.mark("worker")
+        self.assertEqual(timer.snapshot()["steps"], {"config": 1.0, "worker": 0.25})
@@ -0,0 +1,40 @@
+"""
+Test cases for the JSON streaming utility
+
+"""
+import json
+import unittest
+
+from service.utils.streaming import stream_json_array
+
+######################################################################
+#  S T R E A M I N G   T E S T   C A S E S
+######################################################################
+class TestStreamJsonArray(unittest.TestCase):
+    """ Test Cases for stream_json_array """
+
+    def test_empty(self):
+        """ Stream an empty array """
+        self.assertEqual(json.loads("".join(stream_json_array([]))), [])
+
+    def test_chunks(self):
+        """ Stream rows a chunk at a time """
+        rows = [{"user_id": i} for i in range(5)]
+        chunks = list(stream_json_array(rows, chunk_size=2))
+        # the opening bracket, three chunks and the closing bracket
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads("".join(chunks)), rows)
+
+    def test_lazy(self):
+        """ Rows are only consumed as the chunks are sent """
+        consumed = []
+
+        def rows():
+            for i in range(4):
+                consumed.append(i)
+                yield i
+
+        chunks = stream_json_array(rows(), chunk_size=2)
+        self.assertEqual(next(chunks), "[")
+        self.assertEqual(next(chunks), "0, 1")
+        self.assertEqual(consumed, [0, 1])
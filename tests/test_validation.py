@@ -0,0 +1,92 @@
+"""
+Test cases for the compiled request validators
+
+"""
+import unittest
+
+from flask_restx import Model, fields
+
+from service.utils.validation import compile_validator, describe_errors
+
+ITEM = Model('Item', {
+    'item_id': fields.Integer(required=True, min=0),
+    'item_name': fields.String(required=True),
+    'quantity': fields.Integer(required=True, min=1),
+    'price': fields.Float(required=True, min=0, exclusiveMin=True),
+    'hold': fields.Boolean(default=False),
+    'user_id': fields.Integer(readonly=True),
+})
+
+UPDATE = Model('Update', {
+    'quantity': fields.Integer(min=1),
+    'price': fields.Float(min=0, exclusiveMin=True),
+})
+
+######################################################################
+#  V A L I D A T O R   T E S T   C A S E S
+######################################################################
+class TestValidator(unittest.TestCase):
+    """ Test Cases for compile_validator """
+
+    def setUp(self):
+        """ This runs before each test """
+        self.item = {"item_id": 1, "item_name": "ring", "quantity": 2, "price": 9.5}
+
+    def test_validate(self):
+        """ Validate an item, filling defaults and dropping unknown keys """
+        valid, errors = compile_validator(ITEM).validate(dict(self.item, user_id=3, color="red"))
+        self.assertEqual(errors, [])
+        self.assertEqual(valid, dict(self.item, hold=False))
+
+    def test_validate_errors(self):
+        """ Validate an item with every kind of bad field """
+        item = {"item_id": True, "quantity": 0, "price": 0, "hold": "yes"}
+        valid, errors = compile_validator(ITEM).validate(item)
+        self.assertIsNone(valid)
+        self.assertEqual(errors, [
+            {"field": "item_id", "message": "must be an integer"},
+            {"field": "item_name", "message": "is required"},
+            {"field": "quantity", "message": "must be at least 1"},
+            {"field": "price", "message": "must be greater than 0"},
+            {"field": "hold", "message": "must be a boolean"},
+        ])
+
+    def test_validate_not_an_object(self):
+        """ Validate something that is not a JSON object """
+        valid, errors = compile_validator(ITEM).validate([1])
+        self.assertIsNone(valid)
+        self.assertEqual(errors, [{"field": None, "message": "must be a Item object"}])
+
+    def test_validate_many(self):
+        """ Validate a batch of items collecting the errors of all of them """
+        items = [self.item, dict(self.item, price="free"), 1, dict(self.item, item_id=2)]
+        valid, errors = compile_validator(ITEM).validate_many(items)
+        self.assertEqual(len(valid), 2)
+        self.assertEqual([(error["index"], error["field"]) for error in errors], [(1, "price"), (2, None)])
+        self.assertEqual(describe_errors(errors),
+                         "item 1: price must be a number; item 2: must be a Item object")
+
+    def test_require_any(self):
+        """ Validate partial updates that must change something """
+        validator = compile_validator(UPDATE, require_any=True)
+        self.assertEqual(validator.validate({"price": 1}), ({"price": 1}, []))
+        self.assertEqual(validator.validate({}),
+                         (None, [{"field": None, "message": "must have quantity or price"}]))
+        self.assertEqual(compile_validator(UPDATE).validate({}), ({}, []))
+
+    def test_maximum(self):
+        """ Validate the max and enum keywords """
+        validator = compile_validator(Model('Op', {
+            'op': fields.String(enum=["add", "delete"]),
+            'count': fields.Integer(max=10),
+            'ratio': fields.Float(exclusiveMax=1),
+        }))
+        _, errors = validator.validate({"op": "hold", "count": 11, "ratio": 1})
+        self.assertEqual([error["message"] for error in errors],
+                         ["must be one of add, delete", "must be at most 10", "must be less than 1"])
+        self.assertEqual(validator.validate({"op": "add", "count": 10, "ratio": 0.5})[1], [])
+
+    def test_unsupported_field(self):
+        """ Compile a model with a nested field """
+        with self.assertRaises(ValueError):
+            compile_validator(Model('Cart', {'items': fields.List(fields.Integer)}))